@@ -0,0 +1,134 @@
+# Runs the same evaluation as experiment.py with many episodes in flight at once.
+# Episodes are seeded like `experiment.py --seed`, so with a deterministic LLM
+# both produce the same results regardless of how the episodes interleave.
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import json
+import time
+
+import numpy as np
+import smartplay
+
+from loggers import make_logger
+from checkpoint import make_checkpoints
+from scheduler import estimate_costs, lpt_order
+from token_accounting import TokenAccounting
+from experiment import build_query_model, episode_random_state, episode_steps, get_parser, make_env, parse_args, table_columns
+
+class Runner:
+    def __init__(self, args, query_model, logger, checkpoints=None, accounting=None):
+        self.args = args
+        self.query_model = query_model
+        self.logger = logger
+        self.checkpoints = checkpoints
+        self.accounting = accounting
+        # Bounds the LLM requests in flight, and the episodes holding an environment.
+        self.llm_slots = asyncio.Semaphore(args.concurrency)
+        self.episode_slots = asyncio.Semaphore(args.max_episodes)
+        # Environments run in threads, as stepping blocks and may release the GIL.
+        self.env_pool = concurrent.futures.ThreadPoolExecutor(args.env_workers)
+        # Synchronous query functions, such as blocking HTTP clients.
+        self.query_pool = concurrent.futures.ThreadPoolExecutor(args.concurrency)
+        self.queries = 0
+
+    async def in_env_thread(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.env_pool, functools.partial(fn, *args, **kwargs))
+
+    async def query(self, messages, index, **kwargs):
+        async with self.llm_slots:
+            self.queries += 1
+            if inspect.iscoroutinefunction(self.query_model):
+                return await self.query_model(messages, index, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self.query_pool, functools.partial(self.query_model, messages, index, **kwargs))
+
+    async def run_episode(self, env_name, eps):
+        # Plays experiment.episode_steps, awaiting the LLM and environment.
+        if self.checkpoints is not None:
+            result = self.checkpoints.episode(env_name, eps).result()
+            if result is not None:
+                return result
+        async with self.episode_slots:
+            random_state = episode_random_state(self.args.seed, env_name, eps)
+            env = await self.in_env_thread(make_env, env_name, self.args, random_state)
+            try:
+                log = self.logger.episode(env_name, eps, table_columns(self.args.protocol))
+                checkpoint = self.checkpoints.episode(env_name, eps) if self.checkpoints is not None else None
+                account = self.accounting.episode(env_name, eps) if self.accounting is not None else None
+                steps = episode_steps(env, env_name, env.default_steps, self.query_model, random_state, log,
+                                      self.args.protocol, self.args.prompt_layout, checkpoint, account)
+                try:
+                    kind, fn, args, kwargs = next(steps)
+                    while True:
+                        if kind == "llm":
+                            value = await self.query(*args, **kwargs)
+                        else:
+                            value = await self.in_env_thread(fn, *args, **kwargs)
+                        kind, fn, args, kwargs = steps.send(value)
+                except StopIteration as stop:
+                    result = stop.value
+            finally:
+                env.close()
+            self.logger.log("episode", env_name, eps, {key: value for key, value in result.items() if key != "rows"})
+            return result
+
+    async def run(self, env_names):
+        episodes = []
+        for env_name in env_names:
+            env = make_env(env_name, self.args)
+            episodes += [(env_name, eps) for eps in range(env.default_iter)]
+            env.close()
+        # Episodes start longest first, so that the last ones to finish are short.
+        costs = estimate_costs(env_names, self.args)
+        tasks = {episode: asyncio.ensure_future(self.run_episode(*episode)) for episode in lpt_order({episode: costs.get(episode, 0.0) for episode in episodes})}
+        results = await asyncio.gather(*[tasks[episode] for episode in episodes])
+        by_env = {env_name: [] for env_name in env_names}
+        for (env_name, _), result in zip(episodes, results):
+            by_env[env_name].append(result)
+        return by_env
+
+def main(argv=None):
+    parser = get_parser()
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum number of LLM requests in flight')
+    parser.add_argument('--max_episodes', type=int, default=32, help='Maximum number of episodes in flight')
+    parser.add_argument('--env_workers', type=int, default=4, help='Number of threads stepping environments')
+    parser.add_argument('--output', type=str, default=None, help='Write the per-episode results to this JSON file')
+    args = parse_args(parser, argv)
+    if args.adaptive:
+        parser.error("--adaptive is only supported by experiment.py, which plays the episodes of an environment in order")
+    if args.seed is None:
+        args.seed = int(np.random.randint(2**31 - 1))
+        print("Using seed", args.seed)
+
+    query_model, cache = build_query_model(args, asynchronous=True)
+    logger = make_logger(args, "{}-{}".format(args.llm_name, time.strftime("%Y%m%d-%H%M%S")))
+    accounting = TokenAccounting(args.tokenizer) if args.token_report else None
+    runner = Runner(args, query_model, logger, make_checkpoints(args), accounting)
+    start = time.time()
+    try:
+        results = asyncio.run(runner.run(args.env_names.split(',')))
+    finally:
+        logger.close()
+    duration = time.time() - start
+    steps = sum(result["episodic_step"] for episodes in results.values() for result in episodes)
+    print("Ran {} episodes, {} steps and {} LLM queries in {:.1f}s".format(
+        sum(len(episodes) for episodes in results.values()), steps, runner.queries, duration))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, default=float)
+
+    score_dict = {env_name: np.average([result["normalized_score"] for result in episodes]) for env_name, episodes in results.items()}
+    print("Normalized scores on each task:", score_dict)
+    print("Capability scores of the LLM:", smartplay.analyze_capabilities(score_dict))
+    if accounting is not None:
+        accounting.print_summary(accounting.write(args.token_report, normalized_scores=score_dict))
+    if cache is not None:
+        print("LLM response cache:", cache.stats())
+    if hasattr(query_model, 'stats'):
+        print("LLM batches:", query_model.stats())
+    return results
+
+if __name__ == '__main__':
+    main()
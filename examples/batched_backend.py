@@ -0,0 +1,166 @@
+# Local Hugging Face model answering the prompts of many episodes in batches.
+# Prompts submitted while the model is busy, or within `max_wait` seconds of
+# the first prompt of a batch, are generated together, up to `max_batch_size`.
+# Use it through async_runner.py with --llm_name hf:<model>, and at least as
+# many LLM requests in flight (--concurrency) as --max_batch_size.
+import asyncio
+import collections
+import concurrent.futures
+import time
+
+class MicroBatcher:
+    def __init__(self, generate, max_batch_size=8, max_wait=0.02):
+        # `generate` maps a list of prompts to the list of their answers.
+        self.generate = generate
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batch_sizes = collections.Counter()
+        self.generate_seconds = 0.0
+        self.first_submit = None
+        self.last_answer = None
+        self._loop = None
+        self._queue = None
+        # Generation blocks, so it runs in a thread off the event loop.
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    async def submit(self, prompt):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            loop.create_task(self._run())
+        if self.first_submit is None:
+            self.first_submit = time.perf_counter()
+        future = loop.create_future()
+        self._queue.put_nowait((prompt, future))
+        return await future
+
+    def run_now(self, prompt):
+        # Generates a single prompt synchronously, as a batch of one.
+        return self._generate([prompt])[0]
+
+    def _generate(self, prompts):
+        if self.first_submit is None:
+            self.first_submit = time.perf_counter()
+        start = time.perf_counter()
+        answers = self.generate(prompts)
+        self.last_answer = time.perf_counter()
+        self.generate_seconds += self.last_answer - start
+        self.batch_sizes[len(prompts)] += 1
+        return answers
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                answers = await loop.run_in_executor(self._executor, self._generate, [prompt for prompt, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), answer in zip(batch, answers):
+                if not future.done():
+                    future.set_result(answer)
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        prompts = sum(size * count for size, count in self.batch_sizes.items())
+        wall = (self.last_answer - self.first_submit) if batches else 0.0
+        return {
+            "batches": batches,
+            "prompts": prompts,
+            "mean_batch_size": prompts / batches if batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "generate_seconds": self.generate_seconds,
+            "prompts_per_sec": prompts / wall if wall > 0 else 0.0,
+        }
+
+def merge_roles(messages):
+    # Joins consecutive messages of one role, which many chat templates require.
+    merged = []
+    for m in messages:
+        if merged and merged[-1]["role"] == m["role"]:
+            merged[-1] = {"role": m["role"], "content": merged[-1]["content"] + "\n\n" + m["content"]}
+        else:
+            merged.append(dict(m))
+    return merged
+
+class HFGenerator:
+    # Greedy batched generation with a causal language model.
+
+    def __init__(self, model_name, max_new_tokens=256, device=None):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        self.torch = torch
+        self.max_new_tokens = max_new_tokens
+        # Left padding keeps the prompts adjacent to their generated tokens.
+        # Prompts still too long once fit() has cut their history lose their
+        # start rather than the question at their end.
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left", truncation_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype="auto")
+        self.model.to(device or ("cuda" if torch.cuda.is_available() else "cpu")).eval()
+        self.max_prompt_tokens = getattr(self.model.config, "max_position_embeddings", 4096) - max_new_tokens
+
+    def render(self, messages):
+        if self.tokenizer.chat_template:
+            return self.tokenizer.apply_chat_template(merge_roles(messages), tokenize=False, add_generation_prompt=True)
+        return "".join("{}: {}\n\n".format(m["role"], m["content"]) for m in messages) + "assistant: "
+
+    def fit(self, messages, index):
+        # Shortens the history, from messages[index] up to the current
+        # observation, until the prompt fits in the context of the model. Its
+        # oldest messages are dropped, then the last one left is cut from its
+        # start. The observation, the questions and answers of the step and the
+        # question are never cut.
+        messages = [dict(m) for m in messages]
+        end = len(messages) - 2 - 2 * sum(m["role"] == "assistant" for m in messages)
+        excess = len(self.tokenizer.encode(self.render(messages))) - self.max_prompt_tokens
+        while excess > 0 and end - index > 1:
+            del messages[index]
+            end -= 1
+            excess = len(self.tokenizer.encode(self.render(messages))) - self.max_prompt_tokens
+        if excess > 0 and index < end:
+            tokens = self.tokenizer.encode(messages[index]["content"], add_special_tokens=False)
+            messages[index]["content"] = self.tokenizer.decode(tokens[min(len(tokens), excess):])
+        return self.render(messages)
+
+    def __call__(self, prompts):
+        texts = [self.fit(messages, index) for messages, index in prompts]
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True,
+                                max_length=self.max_prompt_tokens, add_special_tokens=not self.tokenizer.chat_template).to(self.model.device)
+        with self.torch.no_grad():
+            outputs = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=False,
+                                          pad_token_id=self.tokenizer.pad_token_id)
+        return [answer.strip() for answer in self.tokenizer.batch_decode(outputs[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)]
+
+def get_query(LLM_name, asynchronous=False, max_batch_size=8, max_wait=0.02, generate=None):
+    # `LLM_name` is hf:<model>. The query function has a `stats` attribute
+    # returning the batch sizes and throughput so far.
+    batcher = MicroBatcher(generate or HFGenerator(LLM_name.split(":", 1)[1]), max_batch_size, max_wait)
+
+    if asynchronous:
+        async def query_model(messages, index):
+            return await batcher.submit((messages, index))
+    else:
+        def query_model(messages, index):
+            return batcher.run_now((messages, index))
+    query_model.stats = batcher.stats
+    return query_model
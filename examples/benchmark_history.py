@@ -0,0 +1,26 @@
+# Measures the per-step overhead of HistoryTracker with and without a token budget.
+import argparse
+import time
+
+from smartplay.utils import HistoryTracker
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--max_steps', type=int, default=50, help='History window in steps')
+parser.add_argument('--token_budget', type=int, default=400, help='Token budget of the history')
+parser.add_argument('--steps', type=int, default=10000, help='Number of steps to measure')
+args = parser.parse_args()
+
+obs = "You chose Rock, and the opponent chose Paper. You lost and received score -1.\nNew round begins."
+
+for name, kwargs in [
+        ("no budget", {}),
+        ("budget, drop", {"token_budget": args.token_budget, "overflow": "drop"}),
+        ("budget, summarize", {"token_budget": args.token_budget, "overflow": "summarize"}),
+    ]:
+    history = HistoryTracker(args.max_steps, **kwargs)
+    start = time.time()
+    for step in range(args.steps):
+        description = history.describe()
+        history.step({"obs": obs, "score": 0})
+    duration = time.time() - start
+    print("{:<18} {:6.1f}us per step, {:5d} characters in final history".format(name, 1e6 * duration / args.steps, len(description)))
@@ -0,0 +1,59 @@
+# Checks that stepping an environment without reading the text observations
+# or the history does not grow memory: the lazy entries of each info must not
+# keep earlier steps alive. Exits with an error if the number of live infos
+# grows after the warmup, or memory by more than --max_growth bytes per step.
+#
+#   python benchmark_memory.py --env_names Crafter,Hanoi3Disk --steps 500
+import argparse
+import gc
+import sys
+import tracemalloc
+import warnings
+
+import gym
+from smartplay.utils import LazyInfo, _Deferred
+
+def live_infos():
+    # Infos and lazy entries still referenced from somewhere.
+    return sum(isinstance(o, (LazyInfo, _Deferred)) for o in gc.get_objects())
+
+def measure(env_name, steps, warmup):
+    # Growth of memory per step after the warmup, and the number of live
+    # infos at the warmup and at most since, sampled every `warmup` steps. The
+    # largest samples are used, as episodes that end free what they held.
+    env = gym.make("smartplay:{}-v0".format(env_name))
+    env.reset()
+    tracemalloc.start()
+    memory, counts = [], []
+    for step in range(steps + 1):
+        if step >= warmup and (step - warmup) % warmup == 0:
+            gc.collect()
+            memory.append(tracemalloc.get_traced_memory()[0])
+            counts.append(live_infos())
+        _, _, done, _ = env.step(env.action_space.sample())[:4]
+        if done:
+            env.reset()
+    tracemalloc.stop()
+    env.close()
+    return (max(memory) - memory[0]) / (steps - warmup), counts[0], max(counts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env_names', type=str, default='Crafter', help='Comma separated list of environments to check')
+    parser.add_argument('--steps', type=int, default=500, help='Steps to play in each environment')
+    parser.add_argument('--warmup', type=int, default=100, help='Steps before the measurement starts')
+    parser.add_argument('--max_growth', type=float, default=4096, help='Largest allowed growth per step, in bytes')
+    args = parser.parse_args(argv)
+    warnings.simplefilter("ignore")
+
+    failed = []
+    for env_name in args.env_names.split(','):
+        growth, before, after = measure(env_name, args.steps, args.warmup)
+        print("{:<30} {:8.1f} bytes per step, live infos and lazy entries {} -> {}".format(env_name, growth, before, after))
+        if growth > args.max_growth or after > before:
+            failed.append(env_name)
+    if failed:
+        sys.exit("Memory grows while stepping: {}".format(", ".join(failed)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Checkpoints of evaluation runs, so that a restarted run skips the episodes
+# it finished and resumes the others from their last checkpointed step.
+#
+# Each episode keeps, under <directory>/<env_name>/<eps>:
+#   result.json   the result once the episode is finished,
+#   state.pkl     the loop state, rewritten every `every` steps,
+#   rows.pkl      the rows of the rollout table, appended at every step.
+import json
+import os
+import pickle
+import warnings
+
+def _write_atomic(path, data):
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class EpisodeCheckpoint:
+    """
+    Checkpoint of one episode. The environment is saved with its snapshot()
+    if it has one, which restore() applies to a fresh environment, and
+    otherwise by pickling it. Environments that can't be pickled are instead
+    rebuilt by replaying the actions taken so far from the random state the
+    episode started with, which reproduces the episode when it is seeded.
+    """
+
+    def __init__(self, directory, every=1):
+        self.directory = directory
+        self.every = max(1, every)
+        self.start_random_state = None
+        self.actions = []
+        self.snapshot = True
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def result(self):
+        # The result of the finished episode without its rows, or None.
+        try:
+            with open(self._path("result.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def start(self, random_state):
+        # Called before the environment is reset, at the start of an episode.
+        self.start_random_state = dict(random_state) if random_state is not None else None
+        self.actions = []
+        for name in ("state.pkl", "rows.pkl"):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    def save(self, env, action, row, state):
+        # Called after each step with the loop state: step, reward, rewards,
+        # done, info, prompter and random_state.
+        self.actions.append(action)
+        with open(self._path("rows.pkl"), "ab") as f:
+            pickle.dump(row, f)
+            rows_bytes = f.tell()
+        if state["step"] % self.every != 0 and not state["done"]:
+            return
+        snapshot = None
+        if self.snapshot:
+            try:
+                if hasattr(env.unwrapped, "snapshot"):
+                    snapshot = ("snapshot", pickle.dumps(env.unwrapped.snapshot()))
+                else:
+                    snapshot = ("pickle", pickle.dumps(env))
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                warnings.warn("Can't snapshot the environment ({}), resuming will replay its actions.".format(e))
+                self.snapshot = False
+        state = dict(state, env=snapshot, rows=len(self.actions), rows_bytes=rows_bytes,
+                     actions=self.actions, start_random_state=self.start_random_state)
+        _write_atomic(self._path("state.pkl"), pickle.dumps(state))
+
+    def restore(self, env):
+        # Returns the loop state of the last checkpoint with its `rows`, or
+        # None if the episode has none. Its `env` is `env` restored from its
+        # snapshot, or the unpickled environment, or None when the actions
+        # have to be replayed from `start_random_state`.
+        try:
+            with open(self._path("state.pkl"), "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        # Rows appended after the checkpoint are dropped, they'll be redone.
+        with open(self._path("rows.pkl"), "r+b") as f:
+            f.truncate(state["rows_bytes"])
+            state["rows"] = [pickle.load(f) for _ in range(state["rows"])]
+        self.start_random_state = state["start_random_state"]
+        self.actions = list(state["actions"])
+        if state["env"] is None:
+            self.snapshot = False
+        elif state["env"][0] == "snapshot":
+            # Wrappers may only step environments that were reset.
+            snapshot = pickle.loads(state["env"][1])
+            env.reset()
+            env.unwrapped.restore(snapshot)
+            state["env"] = env
+        else:
+            state["env"] = pickle.loads(state["env"][1])
+        return state
+
+    def finish(self, result):
+        _write_atomic(self._path("result.json"), json.dumps({k: v for k, v in result.items() if k != "rows"}, default=float).encode("utf-8"))
+        if os.path.exists(self._path("state.pkl")):
+            os.remove(self._path("state.pkl"))
+
+class Checkpoints:
+    def __init__(self, directory, every=1):
+        self.directory = directory
+        self.every = every
+
+    def episode(self, env_name, eps):
+        return EpisodeCheckpoint(os.path.join(self.directory, env_name, str(eps)), self.every)
+
+def make_checkpoints(args):
+    if args.checkpoint_dir is None:
+        return None
+    return Checkpoints(os.path.join(args.checkpoint_dir, args.llm_name), args.checkpoint_every)
@@ -1,137 +1,394 @@
 import os
 os.environ["MINEDOJO_HEADLESS"]="1"
 import argparse
+import contextlib
+import functools
+import json
+import random
+import re
+import threading
+import time
+import zlib
 import numpy as np
 from tqdm import tqdm
 import gym
 import smartplay
+from smartplay.utils import ActionMatcher, approx_token_len
+from prompts import Prompter, compose_ingame_prompt
+from loggers import make_logger
+from checkpoint import make_checkpoints
+from token_accounting import TokenAccounting
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--llm_name', type=str, default='gpt-4', help='Name of the LLM')
-parser.add_argument('--env_names', type=str, default=None, help='Comma separated list of environments to run')
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--llm_name', type=str, default='gpt-4', help='Name of the LLM')
+    parser.add_argument('--env_names', type=str, default=None, help='Comma separated list of environments to run')
+    parser.add_argument('--history_tokens', type=int, default=None, help='Token budget of the history in each prompt')
+    parser.add_argument('--history_overflow', type=str, default='drop', choices=['drop', 'summarize'], help='How to shorten the history to fit the token budget')
+    parser.add_argument('--delta_obs', action='store_true', help='Only describe what changed since the previous step, where the environment supports it')
+    parser.add_argument('--seed', type=int, default=None, help='Run each episode in a fresh environment seeded from this, so that results are reproducible')
+    parser.add_argument('--cache', type=str, default=None, help='SQLite file caching the LLM responses across runs')
+    parser.add_argument('--cache_size_mb', type=float, default=None, help='Evict the least recently used responses beyond this size')
+    parser.add_argument('--cache_params', type=str, default='{}', help='Sampling parameters of the LLM as JSON, part of the cache key')
+    parser.add_argument('--stub_latency', type=float, default=0.0, help='Seconds each answer of the stub-random and stub-heuristic LLMs takes')
+    parser.add_argument('--max_batch_size', type=int, default=8, help='Largest batch of prompts of the hf:<model> LLMs')
+    parser.add_argument('--max_wait_ms', type=float, default=20.0, help='Milliseconds the hf:<model> LLMs wait for more prompts to batch')
+    parser.add_argument('--log_dir', type=str, default='logs', help='Directory of the JSONL logs of each run, empty to disable')
+    parser.add_argument('--wandb', action='store_true', help='Also upload the logs of the run to wandb once it finishes')
+    parser.add_argument('--checkpoint_dir', type=str, default=None, help='Checkpoint the episodes here, and resume the unfinished ones of an earlier run')
+    parser.add_argument('--checkpoint_every', type=int, default=1, help='Steps between checkpoints of the state of an episode')
+    parser.add_argument('--adaptive', action='store_true', help='Stop evaluating an environment once the confidence interval of its normalized score is narrow enough')
+    parser.add_argument('--max_interval', type=float, default=0.1, help='With --adaptive, width of the confidence interval to reach')
+    parser.add_argument('--min_episodes', type=int, default=5, help='With --adaptive, episodes to play before stopping')
+    parser.add_argument('--confidence', type=float, default=0.95, help='With --adaptive, confidence level of the interval')
+    parser.add_argument('--interval', type=str, default='bootstrap', choices=['bootstrap', 'wilson'], help='With --adaptive, bootstrap interval or Wilson interval, which requires scores in [0, 1]')
+    parser.add_argument('--token_report', type=str, default=None, help='Write the tokens of each prompt component per environment, episode and step to this JSON file')
+    parser.add_argument('--tokenizer', type=str, default='approx', help='Tokenizer counting the tokens of --token_report: approx, chars, tiktoken:<encoding> or hf:<model>')
+    parser.add_argument('--benchmark', action='store_true', help='Measure the steps per second of the harness alone, without logging')
+    parser.add_argument('--benchmark_steps', type=int, default=200, help='Steps to measure in each environment with --benchmark')
+    parser.add_argument('--protocol', type=str, default='two_step', choices=['two_step', 'single'], help='Ask for reasoning and action in two completions per step, or in one')
+    parser.add_argument('--prompt_layout', type=str, default='default', choices=['default', 'prefix'], help='Prompt layout, prefix keeps a stable prefix and appends observations for prefix caching')
+    parser.add_argument('--compare_protocols', action='store_true', help='With --benchmark, measure latency and token usage per step of both protocols')
+    return parser
 
-args = parser.parse_args()
-
-if args.env_names is None:
-    args.env_names = ','.join(smartplay.benchmark_games_v0)
-
-LLM_name = args.llm_name
+def parse_args(parser, argv=None):
+    args = parser.parse_args(argv)
+    if args.env_names is None:
+        args.env_names = ','.join(smartplay.benchmark_games_v0)
+    return args
 
 # Replace with your own LLM API.
 # Note: query_model takes two arguments: 1) message in openai chat completion form (list of dictionaries), 
 #                                        2) an index to indicate where the message should be truncated if the length exceeds LLM context length.
-from llm_api import get_query
-query_model = get_query(LLM_name)
+def get_query_model(LLM_name, stub_latency=0.0, asynchronous=False, max_batch_size=8, max_wait=0.02):
+    if LLM_name.startswith('stub'):
+        from stub_llm import get_query
+        return get_query(LLM_name, stub_latency, asynchronous)
+    if LLM_name.startswith('hf:'):
+        from batched_backend import get_query
+        return get_query(LLM_name, asynchronous, max_batch_size, max_wait)
+    from llm_api import get_query
+    return get_query(LLM_name)
+
+def build_query_model(args, asynchronous=False):
+    # Returns the query function, cached if requested, and the cache or None.
+    query_model = get_query_model(args.llm_name, args.stub_latency, asynchronous, args.max_batch_size, args.max_wait_ms / 1e3)
+    if args.cache is None:
+        return query_model, None
+    from llm_cache import ResponseCache, cached
+    max_bytes = None if args.cache_size_mb is None else int(args.cache_size_mb * 2**20)
+    cache = ResponseCache(args.cache, max_bytes)
+    return cached(query_model, cache, args.llm_name, json.loads(args.cache_params)), cache
 
-def compose_ingame_prompt(info, question, past_qa=[]):
-    messages = [
-        {"role": "system", "content" : "You’re a player trying to play the game."}
+questions=[
+        "What is the best action to take? Let's think step by step, ",
+        "Choose the best executable action from the list of all actions. Write the exact chosen action."
     ]
-    
-    if len(info['manual'])>0:
-        messages.append({"role": "system", "content": info['manual']})
 
-    if len(info['history'])>0:
-        messages.append({"role": "system", "content": info['history']})
+protocols = {
+    # Two completions per step, the reasoning and then the action.
+    "two_step": questions,
+    # One completion with the reasoning followed by an action field.
+    "single": [
+        "What is the best action to take? Let's think step by step, then write the exact chosen action from the list of all actions on a last line starting with \"Action:\"."
+    ],
+}
 
-    messages.append({"role": "system", "content": "current step observation: {}".format(info['obs'])})
+def table_columns(protocol):
+    return ["Context", "Step", "OBS", "History", "Score", "Reward", "Total Reward"] + protocols[protocol] + ["Action"]
 
-    if len(past_qa)>0:
-        for q,a in past_qa:
-            messages.append({"role": "user", "content": q})
-            messages.append({"role": "assistant", "content": a})
+_action_field = re.compile(r"^\s*action\s*:(.*)$", re.IGNORECASE | re.MULTILINE)
 
-    messages.append({"role": "user", "content": question})
+def read_action(answer, match_act, protocol):
+    # Single completions name the action in their last action field. Without
+    # one naming an action, the action named first in the answer is taken.
+    if protocol == "single":
+        fields = _action_field.findall(answer)
+        if fields:
+            index = match_act.find(fields[-1])
+            if index is not None:
+                return index
+    return match_act(answer)
 
-    return messages, 2 # This is the index of the history, we will truncate the history if it is too long for LLM
+# Environments draw from the global `random` and `np.random` generators. A
+# seeded episode keeps its own copy of their states and swaps it in while its
+# environment runs, so episodes running in other threads can't interfere.
+# Environments whose `global_random` is False draw only from generators of
+# their own once made, and run without swapping, concurrently with others.
+_random_lock = threading.Lock()
 
-questions=[
-        "What is the best action to take? Let's think step by step, ",
-        "Choose the best executable action from the list of all actions. Write the exact chosen action."
-    ]
+def episode_random_state(seed, env_name, eps):
+    rng = np.random.RandomState([seed, zlib.crc32(env_name.encode()), eps])
+    py_random = random.Random(int(rng.randint(2**31 - 1)))
+    return {"random": py_random.getstate(), "numpy": rng.get_state()}
 
-def run(env_name):
-    normalized_scores = []
-    env = gym.make("smartplay:{}-v0".format(env_name))
-    env_steps = env.default_steps
-    num_iter = env.default_iter
+@contextlib.contextmanager
+def episode_random(state):
+    if state is None:
+        yield
+        return
+    with _random_lock:
+        random.setstate(state["random"])
+        np.random.set_state(state["numpy"])
+        try:
+            yield
+        finally:
+            state["random"] = random.getstate()
+            state["numpy"] = np.random.get_state()
+
+def call_seeded(env, random_state, fn, *args):
+    # Calls `fn`, a method of `env`, with the episode's random state if the
+    # environment draws from the global generators.
+    if not getattr(env.unwrapped, "global_random", True):
+        random_state = None
+    with episode_random(random_state):
+        return fn(*args)
+
+def make_env(env_name, args, random_state=None):
+    with episode_random(random_state):
+        env = gym.make("smartplay:{}-v0".format(env_name))
+    if args.history_tokens is not None:
+        env.unwrapped.history.set_token_budget(args.history_tokens, overflow=args.history_overflow)
+    if args.delta_obs and hasattr(env.unwrapped, 'delta'):
+        env.unwrapped.delta = True
+    return env
 
-    def match_act(output):
-        inds = [(i, output.lower().index(act.lower())) for i, act in enumerate(env.action_list) if act.lower() in output.lower()]
-        if len(inds)>0:
-            # return the action with smallest index
-            return sorted(inds, key=lambda x:x[1])[0][0]
-        else:
-            # print("LLM failed with output \"{}\", taking action 0...".format(output))
-            return 0
-
-    rewards = []
-    progresses = []
-    for eps in tqdm(range(num_iter), desc="Evaluating LLM {} on {}".format(LLM_name, env_name)):
-        import wandb
-        wandb.init(project="SmartPlay", config={"LLM": LLM_name, "env": env_name, "eps": eps, "num_iter": num_iter, "env_steps": env_steps})
+def episode_result(env_name, info, done, step, rewards, rows, prompter):
+    score = info['score']
+    return {
+        "prefix_reuse": prompter.reuse.ratio,
+        "rows": rows,
+        "total_reward": sum(rewards),
+        "score": score,
+        "normalized_score": smartplay.normalize_score(env_name, score),
+        "completion": info['completed'] if done else 0,
+        "episodic_step": step,
+    }
+
+def resume_episode(env, checkpoint):
+    # The loop state of the last checkpoint of the episode, or None. An
+    # environment without a snapshot is rebuilt by replaying the actions.
+    state = checkpoint.restore(env)
+    if state is not None and state["env"] is None:
+        start = state["start_random_state"]
+        with episode_random(dict(start) if start is not None else None):
+            env.reset()
+            for action in state["actions"]:
+                env.step(action)
+        state["env"] = env
+    return state
+
+def episode_steps(env, env_name, env_steps, query_model, random_state=None, log=None, protocol="two_step", layout="default", checkpoint=None, account=None):
+    # Plays one episode, calling `log` with the metrics before each step and
+    # with each finished row of the rollout table. With a `checkpoint`, the
+    # episode is checkpointed after each step and resumed from its last one.
+    # `account` is called with each prompt, answer and its latency.
+    #
+    # A generator, so that drivers decide how to wait: it yields the blocking
+    # calls as ("llm", query, args, kwargs) or ("env", fn, args, {}), is sent
+    # their results, and returns the result of the episode. See run_episode.
+
+    # Takes the action named first in the answer, or action 0 if there is none.
+    match_act = ActionMatcher(env.action_list)
+    state = (yield "env", resume_episode, (env, checkpoint), {}) if checkpoint is not None else None
+
+    if state is None:
         step = 0
-        trajectories = []
-        qa_history = []
-        progress = [0]
         reward = 0
         rewards = []
+        rows = []
         done=False
+        prompter = Prompter(layout, env.unwrapped.history.max_steps, query_model)
+        if checkpoint is not None:
+            checkpoint.start(random_state)
 
-        columns=["Context", "Step", "OBS", "History", "Score", "Reward", "Total Reward"] + questions + ["Action"]
-        wandb_table = wandb.Table(columns=columns)
+        _, info = yield "env", call_seeded, (env, random_state, env.reset), {}
+        prompter.reset(info)
+    else:
+        env, random_state, prompter, info = state["env"], state["random_state"], state["prompter"], state["info"]
+        step, reward, rewards, rows, done = state["step"], state["reward"], state["rewards"], state["rows"], state["done"]
+    
+    while step < env_steps:
 
-        _, info = env.reset()
+        new_row = [info['manual'], step, info['obs'], info['history'], info['score'], reward, sum(rewards)]
+        if log is not None:
+            log(metrics={"metric/total_reward": sum(rewards), 
+                         "metric/score": info['score'],
+                         "metric/reward": reward,
+                         })
+        
+        if done:
+            break
         
-        while step < env_steps:
-
-            new_row = [info['manual'], step, info['obs'], info['history'], info['score'], reward, sum(rewards)]
-            wandb.log({"metric/total_reward".format(eps): sum(rewards), 
-                       "metric/score".format(eps): info['score'],
-                       "metric/reward".format(eps): reward,
-                       })
-            
-            if done:
-                break
-            
-            qa_history = []
-            for question in questions:
-                prompt = compose_ingame_prompt(info, question, qa_history)
-                answer = query_model(*prompt)
-                qa_history.append((question, answer))
-                new_row.append(answer)
-                answer_act = answer
-
-            a = match_act(answer_act)
-            new_row.append(env.action_list[a])
-            _, reward, done, info = env.step(a)
-            rewards.append(reward)
-            score=info['score']
-
-            step += 1
-            wandb_table.add_data(*new_row)
-
-        if not done:
-            completion=0
-        else:
-            completion=info['completed']
-        progresses.append(np.max(progress))
-        wandb.log({"rollout/rollout".format(eps): wandb_table, 
-                "final/total_reward":sum(rewards),
-                "final/score":score,
-                "final/normalized_score":smartplay.normalize_score(env_name, score),
-                "final/completion":completion,
-                "final/episodic_step":step,
-                "final/eps":eps,
-                })
-        normalized_scores.append(smartplay.normalize_score(env_name, score))
-        del wandb_table
-        wandb.finish()
-    return np.average(normalized_scores)
-
-score_dict = {}
-for env_name in args.env_names.split(','):
-    score_dict[env_name] = run(env_name)
-
-print("Normalized scores on each task:", score_dict)
-print("Capability scores of the LLM:", smartplay.analyze_capabilities(score_dict))
+        prompter.observe(info)
+        qa_history = []
+        for question in protocols[protocol]:
+            prompt = prompter.compose(info, question, qa_history)
+            start = time.perf_counter()
+            answer = yield "llm", query_model, prompt, prompter.query_kwargs()
+            if account is not None:
+                account(step, prompt[0], info, len(qa_history), answer, time.perf_counter() - start)
+            qa_history.append((question, answer))
+            new_row.append(answer)
+            answer_act = answer
+
+        a = read_action(answer_act, match_act, protocol)
+        new_row.append(env.action_list[a])
+        _, reward, done, info = yield "env", call_seeded, (env, random_state, env.step, a), {}
+        rewards.append(reward)
+
+        step += 1
+        rows.append(new_row)
+        if log is not None:
+            log(row=new_row)
+        if checkpoint is not None:
+            yield "env", checkpoint.save, (env, a, new_row, {"step": step, "reward": reward, "rewards": rewards, "done": done,
+                                                             "info": info, "prompter": prompter, "random_state": random_state}), {}
+
+    result = episode_result(env_name, info, done, step, rewards, rows, prompter)
+    if checkpoint is not None:
+        checkpoint.finish(result)
+    return result
+
+def run_episode(*args, **kwargs):
+    # Plays an episode of episode_steps, making its calls in this thread.
+    steps = episode_steps(*args, **kwargs)
+    try:
+        _, fn, fn_args, fn_kwargs = next(steps)
+        while True:
+            _, fn, fn_args, fn_kwargs = steps.send(fn(*fn_args, **fn_kwargs))
+    except StopIteration as stop:
+        return stop.value
+
+def run(env_name, args, query_model, logger, checkpoints=None, accounting=None):
+    # Returns the normalized scores of the episodes played.
+    normalized_scores = []
+    env = make_env(env_name, args)
+    env_steps = env.default_steps
+    num_iter = env.default_iter
+    columns = table_columns(args.protocol)
+
+    try:
+        for eps in tqdm(range(num_iter), desc="Evaluating LLM {} on {}".format(args.llm_name, env_name)):
+            # Episodes finished by an earlier run are skipped.
+            checkpoint = checkpoints.episode(env_name, eps) if checkpoints is not None else None
+            result = checkpoint.result() if checkpoint is not None else None
+            if result is None:
+                random_state = None
+                if args.seed is not None:
+                    # Each seeded episode gets a fresh environment, made
+                    # from its random state, as the other drivers do.
+                    random_state = episode_random_state(args.seed, env_name, eps)
+                    env.close()
+                    env = make_env(env_name, args, random_state)
+                result = run_episode(env, env_name, env_steps, query_model, random_state, logger.episode(env_name, eps, columns), args.protocol, args.prompt_layout, checkpoint,
+                                     accounting.episode(env_name, eps) if accounting is not None else None)
+
+            logger.log("episode", env_name, eps, {
+                    "LLM": args.llm_name,
+                    "num_iter": num_iter,
+                    "env_steps": env_steps,
+                    "total_reward": result["total_reward"],
+                    "score": result["score"],
+                    "normalized_score": result["normalized_score"],
+                    "completion": result["completion"],
+                    "episodic_step": result["episodic_step"],
+                    "prefix_reuse": result["prefix_reuse"],
+                    })
+            normalized_scores.append(result["normalized_score"])
+            if args.adaptive and len(normalized_scores) >= args.min_episodes:
+                # Stops once the mean normalized score is known precisely enough.
+                low, high = smartplay.score_interval(normalized_scores, args.confidence, args.interval)
+                if high - low < args.max_interval:
+                    break
+    finally:
+        env.close()
+    return normalized_scores
+
+def benchmark(env_name, args, query_model, protocol):
+    # Plays episodes until `args.benchmark_steps` steps are done. Returns the
+    # steps per second, also with the time spent in the LLM left out, and the
+    # LLM calls, latency and approximate tokens per step.
+    llm = {"time": 0.0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    @functools.wraps(query_model)
+    def timed_query(messages, index, **kwargs):
+        start = time.perf_counter()
+        answer = query_model(messages, index, **kwargs)
+        llm["time"] += time.perf_counter() - start
+        llm["calls"] += 1
+        llm["prompt_tokens"] += sum(approx_token_len(m["content"]) for m in messages)
+        llm["completion_tokens"] += approx_token_len(answer)
+        return answer
+
+    env = make_env(env_name, args)
+    steps = 0
+    eps = 0
+    reuse = []
+    start = time.perf_counter()
+    try:
+        while steps < args.benchmark_steps:
+            random_state = None
+            if args.seed is not None:
+                random_state = episode_random_state(args.seed, env_name, eps)
+                env.close()
+                env = make_env(env_name, args, random_state)
+            result = run_episode(env, env_name, min(env.default_steps, args.benchmark_steps - steps), timed_query, random_state, protocol=protocol, layout=args.prompt_layout)
+            steps += max(result["episodic_step"], 1)
+            reuse.append(result["prefix_reuse"])
+            eps += 1
+    finally:
+        env.close()
+    duration = time.perf_counter() - start
+    return {
+        "steps": steps,
+        "episodes": eps,
+        "steps_per_sec": steps / duration,
+        "harness_steps_per_sec": steps / max(duration - llm["time"], 1e-9),
+        "llm_calls_per_step": llm["calls"] / steps,
+        "llm_ms_per_step": 1e3 * llm["time"] / steps,
+        "prompt_tokens_per_step": llm["prompt_tokens"] / steps,
+        "completion_tokens_per_step": llm["completion_tokens"] / steps,
+        "prefix_reuse": np.average(reuse),
+    }
+
+def main(argv=None):
+    args = parse_args(get_parser(), argv)
+    query_model, cache = build_query_model(args)
+
+    if args.benchmark:
+        for env_name in args.env_names.split(','):
+            for protocol in (protocols if args.compare_protocols else [args.protocol]):
+                result = benchmark(env_name, args, query_model, protocol)
+                print("{:<30} {:<8} {:6d} steps, {:8.1f} steps/s, {:8.1f} steps/s without LLM time, {:5.1%} prefix reuse".format(
+                    env_name, protocol, result["steps"], result["steps_per_sec"], result["harness_steps_per_sec"], result["prefix_reuse"]))
+                if args.compare_protocols:
+                    print("{:<39} {:4.1f} LLM calls, {:7.1f}ms LLM time, {:7.0f} prompt and {:4.0f} completion tokens per step".format(
+                        "", result["llm_calls_per_step"], result["llm_ms_per_step"], result["prompt_tokens_per_step"], result["completion_tokens_per_step"]))
+        return
+
+    logger = make_logger(args, "{}-{}".format(args.llm_name, time.strftime("%Y%m%d-%H%M%S")))
+    checkpoints = make_checkpoints(args)
+    accounting = TokenAccounting(args.tokenizer) if args.token_report else None
+    score_dict = {}
+    episodes = {}
+    try:
+        for env_name in args.env_names.split(','):
+            normalized_scores = run(env_name, args, query_model, logger, checkpoints, accounting)
+            score_dict[env_name] = np.average(normalized_scores)
+            episodes[env_name] = len(normalized_scores)
+    finally:
+        logger.close()
+
+    print("Normalized scores on each task:", score_dict)
+    if args.adaptive:
+        print("Episodes played on each task:", episodes)
+    print("Capability scores of the LLM:", smartplay.analyze_capabilities(score_dict))
+    if accounting is not None:
+        accounting.print_summary(accounting.write(args.token_report, normalized_scores=score_dict))
+    if cache is not None:
+        print("LLM response cache:", cache.stats())
+    if hasattr(query_model, 'stats'):
+        print("LLM batches:", query_model.stats())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Measures the time `import smartplay` takes in a fresh interpreter, the heavy
+# dependencies it loads, and the time the first gym.make of each game takes,
+# which is when the game itself is imported.
+#
+#   python import_benchmark.py --repeat 10 --env_names Crafter,Hanoi3Disk
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["minedojo", "vgdl", "pygame", "torch", "smartplay.crafter", "smartplay.messenger_emma", "smartplay.minedojo"]
+
+_PROBE = """
+import json, sys, time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+import smartplay
+imported = time.perf_counter() - start
+result = {"import": imported, "envs": len(smartplay.env_list), "loaded": [m for m in %r if m in sys.modules]}
+env_name = %r
+if env_name:
+    import gym
+    start = time.perf_counter()
+    try:
+        gym.make("smartplay:{}-v0".format(env_name))
+        result["make"] = time.perf_counter() - start
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+print(json.dumps(result))
+"""
+
+def probe(env_name=None):
+    output = subprocess.run([sys.executable, "-c", _PROBE % (HEAVY_MODULES, env_name)], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters to measure')
+    parser.add_argument('--env_names', type=str, default='', help='Comma separated list of environments to time the first gym.make of')
+    args = parser.parse_args(argv)
+
+    runs = [probe() for _ in range(args.repeat)]
+    print("import smartplay: {:.3f}s median of {}, {} environments, heavy modules loaded: {}".format(
+        statistics.median(run["import"] for run in runs), args.repeat, runs[0]["envs"], runs[0]["loaded"] or "none"))
+    for env_name in filter(None, args.env_names.split(',')):
+        runs = [probe(env_name) for _ in range(args.repeat)]
+        if "error" in runs[0]:
+            print("{:<30} {}".format(env_name, runs[0]["error"]))
+        else:
+            print("{:<30} first gym.make {:.3f}s median".format(env_name, statistics.median(run["make"] for run in runs)))
+
+if __name__ == '__main__':
+    main()
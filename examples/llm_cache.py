@@ -0,0 +1,131 @@
+# Disk-backed cache of LLM responses, keyed by a hash of the prompt messages,
+# the model name and the sampling parameters.
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses
+    BEGIN UPDATE totals SET size = size + new.size; END;
+CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses
+    BEGIN UPDATE totals SET size = size - old.size; END;
+"""
+
+def cache_key(messages, model, params=None):
+    payload = json.dumps({"model": model, "params": params or {}, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    SQLite cache of responses that many threads and processes on one host can
+    share. The least recently used responses are evicted once the responses
+    exceed `max_bytes` in total.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread
+        # opens its own. WAL lets readers proceed while another process writes.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, response):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            connection.execute("INSERT INTO responses VALUES (?, ?, ?, ?)", (key, response, len(response.encode("utf-8")), time.time()))
+            if self.max_bytes is not None:
+                self._evict(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _evict(self, connection):
+        # Evicts down to 90% of the limit, so that eviction isn't needed again
+        # on the next insertion.
+        size, = connection.execute("SELECT size FROM totals").fetchone()
+        if size <= self.max_bytes:
+            return
+        excess = size - int(0.9 * self.max_bytes)
+        keys = []
+        for key, entry_size in connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            keys.append((key,))
+            excess -= entry_size
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def stats(self):
+        connection = self._connection()
+        entries, = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        size, = connection.execute("SELECT size FROM totals").fetchone()
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "entries": entries, "bytes": size}
+
+def cached(query_model, cache, model, params=None):
+    # Wraps a query function taking (messages, index), synchronous or async.
+    # Other keyword arguments, such as prefix_hash, are passed on but aren't
+    # part of the key.
+    def lookup(messages):
+        key = cache_key(messages, model, params)
+        return key, cache.get(key)
+
+    if inspect.iscoroutinefunction(query_model):
+        @functools.wraps(query_model)
+        async def query(messages, index, **kwargs):
+            key, response = lookup(messages)
+            if response is None:
+                response = await query_model(messages, index, **kwargs)
+                cache.put(key, response)
+            return response
+    else:
+        @functools.wraps(query_model)
+        def query(messages, index, **kwargs):
+            key, response = lookup(messages)
+            if response is None:
+                response = query_model(messages, index, **kwargs)
+                cache.put(key, response)
+            return response
+    return query
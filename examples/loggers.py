@@ -0,0 +1,126 @@
+# Metrics logging for the evaluation runners. Records are buffered and handed
+# to the sinks in batches by a background thread, so logging never waits on
+# disk or network in the evaluation loop.
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+class JSONLSink:
+    # Appends each record as a line of JSON.
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, records):
+        self._file.write("".join(json.dumps(record, default=_default) + "\n" for record in records))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class WandbSink:
+    # Keeps the records and uploads them as one wandb run when closed, with a
+    # table of episodes, a table of all rollout rows and the per-step metrics.
+
+    def __init__(self, project, config):
+        self.project = project
+        self.config = config
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+    def close(self):
+        import wandb
+        run = wandb.init(project=self.project, config=self.config)
+        episodes = [r for r in self.records if r["kind"] == "episode"]
+        rows = [r for r in self.records if r["kind"] == "row"]
+        if episodes:
+            columns = list(episodes[0]["data"])
+            run.log({"final/episodes": wandb.Table(columns=["env", "eps"] + columns, data=[[r["env"], r["eps"]] + [r["data"].get(c) for c in columns] for r in episodes])})
+        if rows:
+            columns = list(rows[0]["data"])
+            run.log({"rollout/rollout": wandb.Table(columns=["env", "eps"] + columns, data=[[r["env"], r["eps"]] + [r["data"].get(c) for c in columns] for r in rows])})
+        for r in self.records:
+            if r["kind"] == "step":
+                run.log({"{}/{}".format(r["env"], k): v for k, v in r["data"].items()})
+        run.finish()
+
+class Logger:
+    """
+    Buffers records and writes them to the sinks from a background thread,
+    every `flush_interval` seconds or once `max_buffer` records are waiting.
+    Logging from several threads is safe.
+    """
+
+    def __init__(self, sinks, flush_interval=1.0, max_buffer=1000):
+        self.sinks = list(sinks)
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="logger", daemon=True)
+        self._thread.start()
+
+    def log(self, kind, env, eps, data):
+        self._queue.put({"kind": kind, "env": env, "eps": eps, "time": time.time(), "data": data})
+
+    def episode(self, env, eps, columns=None):
+        # Returns the `log` callback of experiment.run_episode for an episode.
+        def log(metrics=None, row=None):
+            if metrics is not None:
+                self.log("step", env, eps, metrics)
+            if row is not None:
+                self.log("row", env, eps, dict(zip(columns, row)) if columns else list(row))
+        return log
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_buffer:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            if batch:
+                for sink in self.sinks:
+                    sink.write(batch)
+
+    def close(self):
+        # Writes out everything logged so far, then closes the sinks.
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        for sink in self.sinks:
+            sink.close()
+
+def make_logger(args, run_name):
+    # JSONL in `args.log_dir`, and wandb in bulk at the end with `args.wandb`.
+    sinks = []
+    if args.log_dir:
+        sinks.append(JSONLSink(os.path.join(args.log_dir, "{}.jsonl".format(run_name))))
+    if args.wandb:
+        sinks.append(WandbSink("SmartPlay", {k: v for k, v in vars(args).items()}))
+    return Logger(sinks)
@@ -0,0 +1,128 @@
+# Prompt layout that keeps consecutive prompts of an episode identical up to
+# their last few messages, so that LLM servers can reuse their prefix caches.
+import hashlib
+import inspect
+import json
+import os
+
+def compose_ingame_prompt(info, question, past_qa=[]):
+    messages = [
+        {"role": "system", "content" : "You’re a player trying to play the game."}
+    ]
+    
+    if len(info['manual'])>0:
+        messages.append({"role": "system", "content": info['manual']})
+
+    if len(info['history'])>0:
+        messages.append({"role": "system", "content": info['history']})
+
+    messages.append({"role": "system", "content": "current step observation: {}".format(info['obs'])})
+
+    if len(past_qa)>0:
+        for q,a in past_qa:
+            messages.append({"role": "user", "content": q})
+            messages.append({"role": "assistant", "content": a})
+
+    messages.append({"role": "user", "content": question})
+
+    return messages, 2 # This is the index of the history, we will truncate the history if it is too long for LLM
+
+class PrefixPromptBuilder:
+    """
+    Builds prompts as a stable prefix, the role and the manual with its list
+    of actions, followed by the observations of the episode so far and the
+    questions of the current step. Observations are only ever appended, and
+    dropped in bulk once there are twice `window` of them, so the messages of
+    a prompt are repeated by every later prompt until the next drop.
+    """
+
+    def __init__(self, window):
+        self.window = max(1, window)
+        self.prefix = []
+        self.prefix_hash = None
+        self.turns = []
+        self.step = 0
+
+    def reset(self, info):
+        self.prefix = [{"role": "system", "content" : "You’re a player trying to play the game."}]
+        if len(info['manual'])>0:
+            self.prefix.append({"role": "system", "content": info['manual']})
+        # Backends can key cached state of the prefix by this hash.
+        self.prefix_hash = hashlib.sha256(json.dumps(self.prefix, sort_keys=True).encode("utf-8")).hexdigest()
+        self.turns = []
+        self.step = 0
+
+    def observe(self, info):
+        self.turns.append({"role": "user", "content": "Step {} observation:\n{}".format(self.step, info['obs'])})
+        self.step += 1
+        if len(self.turns) > 2 * self.window:
+            del self.turns[:-self.window]
+
+    def compose(self, info, question, past_qa=[]):
+        messages = self.prefix + self.turns
+        for q,a in past_qa:
+            messages.append({"role": "user", "content": q})
+            messages.append({"role": "assistant", "content": a})
+        messages.append({"role": "user", "content": question})
+        # Truncation starts after the prefix, from the oldest observation.
+        return messages, len(self.prefix)
+
+class PrefixReuse:
+    # Share of prompt characters that repeat the start of the previous prompt,
+    # the part a prefix cache could have served.
+
+    def __init__(self):
+        self.previous = []
+        self.reused = 0
+        self.total = 0
+
+    def add(self, messages):
+        texts = ["{}\n{}".format(m["role"], m["content"]) for m in messages]
+        reused = 0
+        for previous, text in zip(self.previous, texts):
+            if previous != text:
+                reused += len(os.path.commonprefix([previous, text]))
+                break
+            reused += len(text)
+        self.reused += reused
+        self.total += sum(len(text) for text in texts)
+        self.previous = texts
+
+    @property
+    def ratio(self):
+        return self.reused / self.total if self.total else 0.0
+
+class Prompter:
+    # Composes the prompts of one episode in the "default" layout of
+    # compose_ingame_prompt or the "prefix" layout, measuring prefix reuse.
+
+    def __init__(self, layout, window, query_model):
+        self.builder = PrefixPromptBuilder(window) if layout == "prefix" else None
+        self.reuse = PrefixReuse()
+        self.pass_hash = self.builder is not None and accepts_prefix_hash(query_model)
+
+    def reset(self, info):
+        if self.builder is not None:
+            self.builder.reset(info)
+
+    def observe(self, info):
+        if self.builder is not None:
+            self.builder.observe(info)
+
+    def compose(self, info, question, past_qa=[]):
+        if self.builder is not None:
+            prompt = self.builder.compose(info, question, past_qa)
+        else:
+            prompt = compose_ingame_prompt(info, question, past_qa)
+        self.reuse.add(prompt[0])
+        return prompt
+
+    def query_kwargs(self):
+        # Query functions taking a `prefix_hash` argument are passed the hash.
+        return {"prefix_hash": self.builder.prefix_hash} if self.pass_hash else {}
+
+def accepts_prefix_hash(query_model):
+    try:
+        return "prefix_hash" in inspect.signature(query_model).parameters
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,110 @@
+# Orders the episodes of an evaluation by their estimated cost, longest first,
+# so that workers playing them in that order finish close together (LPT
+# scheduling). The cost of an episode is its expected number of steps times
+# the seconds a step takes, measured from the logs of earlier runs.
+#
+#   python scheduler.py --env_names ... --workers 8 --log_dir logs
+import glob
+import heapq
+import json
+import os
+
+import smartplay
+
+from experiment import get_parser, make_env, parse_args
+
+def measured_steps(log_dir):
+    # Seconds per step and steps per episode of each environment, from the
+    # JSONL logs of earlier runs in `log_dir`.
+    times = {}
+    episode_steps = {}
+    for path in glob.glob(os.path.join(log_dir, "*.jsonl")):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record["kind"] == "step":
+                    times.setdefault((path, record["env"], record["eps"]), []).append(record["time"])
+                elif record["kind"] == "episode":
+                    episode_steps.setdefault(record["env"], []).append(record["data"]["episodic_step"])
+    seconds = {}
+    for (_, env_name, _), stamps in times.items():
+        if len(stamps) > 1:
+            total, steps = seconds.get(env_name, (0.0, 0))
+            seconds[env_name] = (total + stamps[-1] - stamps[0], steps + len(stamps) - 1)
+    step_seconds = {env_name: total / steps for env_name, (total, steps) in seconds.items()}
+    mean_steps = {env_name: sum(steps) / len(steps) for env_name, steps in episode_steps.items() if steps}
+    return step_seconds, mean_steps
+
+def env_settings(env_name, args=None):
+    # Episodes and steps per episode, from recorded_settings without making
+    # the environment where possible.
+    setting = smartplay.recorded_settings.get(env_name, {})
+    if "iter" in setting and "steps" in setting:
+        return setting["iter"], setting["steps"]
+    env = make_env(env_name, args)
+    settings = env.default_iter, env.default_steps
+    env.close()
+    return settings
+
+def episode_costs(env_names, args=None, step_seconds=None, mean_steps=None, default_step_seconds=1.0):
+    # Estimated seconds of every (env_name, eps).
+    step_seconds = step_seconds or {}
+    mean_steps = mean_steps or {}
+    costs = {}
+    for env_name in env_names:
+        num_iter, steps = env_settings(env_name, args)
+        # Episodes can end early, such as Hanoi once it is solved.
+        steps = min(steps, mean_steps.get(env_name, steps))
+        for eps in range(num_iter):
+            costs[(env_name, eps)] = steps * step_seconds.get(env_name, default_step_seconds)
+    return costs
+
+def estimate_costs(env_names, args, default_step_seconds=1.0):
+    # Costs measured from the logs in `args.log_dir`, where there are any.
+    step_seconds, mean_steps = measured_steps(args.log_dir) if args.log_dir else ({}, {})
+    return episode_costs(env_names, args, step_seconds, mean_steps, default_step_seconds)
+
+def lpt_order(costs):
+    # Longest first. Workers taking the next episode whenever they are free
+    # then end within the cost of one episode of each other.
+    return sorted(costs, key=lambda episode: (-costs[episode], episode))
+
+def lpt_schedule(costs, workers):
+    # Assigns each episode, longest first, to the least loaded worker. Returns
+    # the episodes of each worker and the makespan.
+    loads = [(0.0, worker) for worker in range(workers)]
+    assignment = [[] for _ in range(workers)]
+    for episode in lpt_order(costs):
+        load, worker = heapq.heappop(loads)
+        assignment[worker].append(episode)
+        heapq.heappush(loads, (load + costs[episode], worker))
+    return assignment, max(load for load, _ in loads)
+
+def in_order_makespan(costs, workers):
+    # Makespan of workers taking the episodes in the order of `costs`.
+    loads = [0.0] * workers
+    for episode in costs:
+        heapq.heapreplace(loads, loads[0] + costs[episode])
+    return max(loads)
+
+def main(argv=None):
+    parser = get_parser()
+    parser.add_argument('--workers', type=int, default=8, help='Number of episodes played at once')
+    parser.add_argument('--step_seconds', type=float, default=1.0, help='Seconds per step of the environments without logs')
+    args = parse_args(parser, argv)
+    step_seconds, mean_steps = measured_steps(args.log_dir) if args.log_dir else ({}, {})
+    env_names = args.env_names.split(',')
+    costs = episode_costs(env_names, args, step_seconds, mean_steps, args.step_seconds)
+
+    for env_name in env_names:
+        env_costs = [cost for (name, _), cost in costs.items() if name == env_name]
+        print("{:<30} {:4d} episodes of {:10.1f}s, {:8.3f}s per step{}".format(
+            env_name, len(env_costs), env_costs[0] if env_costs else 0.0, step_seconds.get(env_name, args.step_seconds),
+            "" if env_name in step_seconds else " (default)"))
+    assignment, makespan = lpt_schedule(costs, args.workers)
+    print("Makespan on {} workers: {:.0f}s longest first, {:.0f}s in order, {:.0f}s of work in total".format(
+        args.workers, makespan, in_order_makespan(costs, args.workers), sum(costs.values())))
+    return assignment
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Stand-in for an LLM API that answers with an action from the game manual,
+# for measuring the harness without waiting on a real model. Use it through
+# experiment.py with --llm_name stub-random or stub-heuristic.
+import asyncio
+import hashlib
+import random
+import re
+import time
+
+_numbered = re.compile(r"^(\d+)\. ([^:\n]+)", re.MULTILINE)
+# Observation messages of either layout of prompts.py.
+_observation = re.compile(r"^(current step observation: |Step \d+ observation:\n)")
+
+def manual_actions(manual):
+    # Every manual ends with the list of actions, numbered from 1.
+    actions = []
+    for number, action in _numbered.findall(manual):
+        if number == "1":
+            actions = []
+        actions.append(action.strip())
+    return actions
+
+def choose_action(messages, policy):
+    # Answers are a function of the prompt alone, so reruns and concurrent
+    # runners get the same answers for the same prompts.
+    rng = random.Random(hashlib.sha1(repr(messages).encode("utf-8")).digest())
+    # Both layouts put the manual second, and observations are system
+    # messages in one and user messages in the other.
+    actions = manual_actions(messages[1]["content"]) if len(messages) > 2 else []
+    if not actions:
+        return "nothing"
+    if policy == "heuristic":
+        # Prefer the actions whose words appear in the current observation.
+        observations = [m["content"] for m in messages if _observation.match(m["content"])]
+        observation = observations[-1].lower() if observations else ""
+        scores = [sum(word in observation for word in action.lower().split()) for action in actions]
+        best = max(scores)
+        actions = [action for action, score in zip(actions, scores) if score == best]
+    return rng.choice(actions)
+
+def answer(messages, policy):
+    action = choose_action(messages, policy)
+    if any(m["role"] == "assistant" for m in messages):
+        return action
+    reasoning = "Looking at the observation, the best action to take is {}.".format(action)
+    if '"Action:"' in messages[-1]["content"]:
+        return "{}\nAction: {}".format(reasoning, action)
+    return reasoning
+
+def get_query(LLM_name, latency=0.0, asynchronous=False):
+    # `LLM_name` is stub-random or stub-heuristic, and `latency` the seconds
+    # each answer takes. Like a server with a prefix cache, the stub accepts
+    # the prefix hash of the prompt, but has no use for it.
+    policy = LLM_name.split("-", 1)[1] if "-" in LLM_name else "random"
+    if policy not in ("random", "heuristic"):
+        raise ValueError("Unknown stub policy `{}`.".format(policy))
+
+    if asynchronous:
+        async def query_model(messages, index, prefix_hash=None):
+            if latency > 0:
+                await asyncio.sleep(latency)
+            return answer(messages, policy)
+    else:
+        def query_model(messages, index, prefix_hash=None):
+            if latency > 0:
+                time.sleep(latency)
+            return answer(messages, policy)
+    return query_model
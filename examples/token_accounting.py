@@ -0,0 +1,124 @@
+# Counts where the tokens of the prompts go: the role prompt, the manual, the
+# history, the current observation, the questions and answers of the step so
+# far and the question, with the completion and latency of each LLM call.
+import json
+
+from smartplay.utils import approx_token_len
+
+COMPONENTS = ["role", "manual", "history", "obs", "qa", "question", "completion"]
+
+def get_tokenizer(name):
+    # Returns a function counting the tokens of a text: "approx" for about four
+    # characters per token, "chars", "tiktoken:<encoding>" or "hf:<model>".
+    if name == "approx":
+        return approx_token_len
+    if name == "chars":
+        return len
+    kind, _, model = name.partition(":")
+    if kind == "tiktoken":
+        import tiktoken
+        encoding = tiktoken.get_encoding(model or "cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    if kind == "hf":
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    raise ValueError("Unknown tokenizer `{}`.".format(name))
+
+def split_prompt(messages, info, num_qa):
+    # Component of each message. Prompts of either layout of prompts.py end
+    # with the current observation, `num_qa` questions and answers, and the
+    # question. The messages before are the role prompt, the manual and the
+    # history, including the earlier observations of the prefix layout.
+    obs_index = len(messages) - 2 - 2 * num_qa
+    components = []
+    for i, message in enumerate(messages):
+        if i == len(messages) - 1:
+            components.append("question")
+        elif i > obs_index:
+            components.append("qa")
+        elif i == obs_index:
+            components.append("obs")
+        elif message["content"] == info["manual"]:
+            components.append("manual")
+        elif message["content"] == info["history"] or message["role"] == "user":
+            components.append("history")
+        else:
+            components.append("role")
+    return components
+
+class TokenAccounting:
+    def __init__(self, tokenizer="approx", bin_size=10):
+        self.tokenizer = tokenizer
+        self.count = get_tokenizer(tokenizer)
+        self.bin_size = bin_size
+        # One (env_name, eps, step, component, tokens, chars) per component of
+        # each prompt, and one (env_name, eps, step, seconds) per LLM call.
+        self.records = []
+        self.calls = []
+
+    def add(self, env_name, eps, step, messages, info, num_qa, answer, seconds):
+        texts = {}
+        for component, message in zip(split_prompt(messages, info, num_qa), messages):
+            texts.setdefault(component, []).append(message["content"])
+        texts["completion"] = [answer]
+        for component, parts in texts.items():
+            self.records.append((env_name, eps, step, component, sum(self.count(text) for text in parts), sum(len(text) for text in parts)))
+        self.calls.append((env_name, eps, step, seconds))
+
+    def episode(self, env_name, eps):
+        # Returns the `account` callback of experiment.run_episode for an episode.
+        def account(step, messages, info, num_qa, answer, seconds):
+            self.add(env_name, eps, step, messages, info, num_qa, answer, seconds)
+        return account
+
+    def report(self):
+        # Tokens and characters per step of each component, for each env, and
+        # tokens of each component per episode and per bin of step indices.
+        report = {"tokenizer": self.tokenizer, "bin_size": self.bin_size, "envs": {}}
+        for env_name in sorted({record[0] for record in self.records}):
+            records = [record for record in self.records if record[0] == env_name]
+            calls = [call for call in self.calls if call[0] == env_name]
+            steps = len({(eps, step) for _, eps, step, _, _, _ in records})
+            by_component = {component: [r for r in records if r[3] == component] for component in COMPONENTS}
+            prompt_tokens = sum(r[4] for r in records if r[3] != "completion")
+            env_report = {
+                "steps": steps,
+                "episodes": len({r[1] for r in records}),
+                "llm_calls_per_step": len(calls) / steps,
+                "llm_seconds_per_step": sum(call[3] for call in calls) / steps,
+                "prompt_tokens_per_step": prompt_tokens / steps,
+                "tokens_per_step": {c: sum(r[4] for r in rs) / steps for c, rs in by_component.items()},
+                "chars_per_step": {c: sum(r[5] for r in rs) / steps for c, rs in by_component.items()},
+                "prompt_share": {c: sum(r[4] for r in rs) / max(prompt_tokens, 1) for c, rs in by_component.items() if c != "completion"},
+                "per_episode": {},
+                "per_step_bin": {},
+            }
+            for _, eps, step, component, tokens, _ in records:
+                episode = env_report["per_episode"].setdefault(str(eps), dict.fromkeys(COMPONENTS, 0))
+                episode[component] += tokens
+            bins = {}
+            for _, eps, step, component, tokens, _ in records:
+                steps_in_bin, totals = bins.setdefault(step // self.bin_size, (set(), dict.fromkeys(COMPONENTS, 0)))
+                steps_in_bin.add((eps, step))
+                totals[component] += tokens
+            for index, (steps_in_bin, totals) in sorted(bins.items()):
+                label = "{}-{}".format(index * self.bin_size, (index + 1) * self.bin_size - 1)
+                env_report["per_step_bin"][label] = {c: total / len(steps_in_bin) for c, total in totals.items()}
+            report["envs"][env_name] = env_report
+        return report
+
+    def print_summary(self, report=None):
+        report = report or self.report()
+        print("Tokens per step ({}):".format(report["tokenizer"]))
+        print("{:<30} ".format("") + " ".join("{:>10}".format(c) for c in COMPONENTS) + " {:>10}".format("LLM s"))
+        for env_name, env_report in report["envs"].items():
+            print("{:<30} ".format(env_name) + " ".join("{:10.0f}".format(env_report["tokens_per_step"][c]) for c in COMPONENTS)
+                  + " {:10.2f}".format(env_report["llm_seconds_per_step"]))
+
+    def write(self, path, **extra):
+        # Writes the report, with `extra` entries such as the normalized scores.
+        report = dict(self.report(), **extra)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report
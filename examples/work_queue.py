@@ -0,0 +1,278 @@
+# Evaluation spread over any number of workers, on one or many machines
+# sharing a filesystem. Every (LLM, environment, episode) is an item in a queue
+# directory, which workers claim by atomically renaming it:
+#   pending/   items waiting for a worker,
+#   claimed/   items being played, whose modification time is the heartbeat
+#              of the lease of their worker,
+#   done/      the results of the finished items,
+#   failed/    items that failed `max_attempts` times, with their last error.
+#
+#   python work_queue.py init --queue_dir q --llm_name gpt-4 --env_names ... --seed 0
+#   python work_queue.py work --queue_dir q      (on as many machines as needed)
+#   python work_queue.py merge --queue_dir q
+#
+# An item whose lease expires is put back, so that another worker retries it.
+# Episodes are seeded, so an item played twice has the same result either way.
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import urllib.parse
+import uuid
+
+import numpy as np
+import smartplay
+
+from checkpoint import make_checkpoints
+from loggers import make_logger
+from scheduler import estimate_costs
+from experiment import build_query_model, episode_random_state, get_parser, make_env, parse_args, run_episode
+
+# Flags of each worker rather than of the evaluation.
+WORKER_ARGS = ("cache", "cache_size_mb", "cache_params", "stub_latency", "max_batch_size", "max_wait_ms", "log_dir", "wandb", "checkpoint_dir", "checkpoint_every")
+QUEUE_ARGS = ("command", "queue_dir", "lease", "max_attempts", "poll_interval", "llm_name")
+
+def _write_json(path, value):
+    # Writes through a hidden temporary file, so no one reads half a file.
+    tmp = os.path.join(os.path.dirname(path), ".{}.{}.tmp".format(os.path.basename(path), uuid.uuid4().hex))
+    with open(tmp, "w") as f:
+        json.dump(value, f, default=float)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+class WorkQueue:
+    def __init__(self, directory, lease=600.0, max_attempts=3):
+        self.directory = directory
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._costs_cache = {}
+        self._costs_mtime = None
+        for state in ("pending", "claimed", "done", "failed"):
+            os.makedirs(self._path(state), exist_ok=True)
+
+    def _path(self, state, name=""):
+        return os.path.join(self.directory, state, name)
+
+    def _names(self, state):
+        return sorted(name for name in os.listdir(self._path(state)) if name.endswith(".json") and not name.startswith("."))
+
+    @staticmethod
+    def item_name(item):
+        return "{}.json".format(urllib.parse.quote("{}|{}|{}".format(item["llm"], item["env"], item["eps"]), safe=""))
+
+    def put(self, items, costs):
+        # Adds the items not already queued, played or done, with their costs.
+        # Returns the number added.
+        costs = dict(self._costs(), **{self.item_name(item): cost for item, cost in zip(items, costs)})
+        _write_json(os.path.join(self.directory, "costs.json"), costs)
+        added = 0
+        for item in items:
+            name = self.item_name(item)
+            if not any(os.path.exists(self._path(state, name)) for state in ("pending", "claimed", "done", "failed")):
+                _write_json(self._path("pending", name), dict(item, attempts=0))
+                added += 1
+        return added
+
+    def _costs(self):
+        # Estimated cost of the items, reloaded when another process adds items.
+        path = os.path.join(self.directory, "costs.json")
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return {}
+        if self._costs_mtime != mtime:
+            self._costs_cache, self._costs_mtime = _read_json(path), mtime
+        return self._costs_cache
+
+    def claim(self, worker):
+        # Returns the name and content of a claimed item, or None if no item is
+        # pending. The most costly items are claimed first, see scheduler.py.
+        costs = self._costs()
+        for name in sorted(self._names("pending"), key=lambda name: -costs.get(name, 0.0)):
+            try:
+                os.rename(self._path("pending", name), self._path("claimed", name))
+            except FileNotFoundError:
+                continue  # Claimed by another worker.
+            # Renaming keeps the time the item was queued, which would make
+            # its lease look expired to other workers.
+            try:
+                os.utime(self._path("claimed", name))
+            except FileNotFoundError:
+                continue  # Already reclaimed by another worker.
+            item = _read_json(self._path("claimed", name))
+            item.update(worker=worker, claimed=time.time())
+            _write_json(self._path("claimed", name), item)
+            return name, item
+        return None
+
+    def heartbeat(self, name):
+        try:
+            os.utime(self._path("claimed", name))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, name, result):
+        _write_json(self._path("done", name), result)
+        try:
+            os.remove(self._path("claimed", name))
+        except FileNotFoundError:
+            pass
+
+    def release(self, name, error):
+        # Puts a failed item back, or into failed/ after its last attempt.
+        try:
+            item = _read_json(self._path("claimed", name))
+        except FileNotFoundError:
+            return
+        item["attempts"] += 1
+        item["error"] = error
+        state = "failed" if item["attempts"] >= self.max_attempts else "pending"
+        _write_json(self._path("claimed", name), item)
+        try:
+            os.rename(self._path("claimed", name), self._path(state, name))
+        except FileNotFoundError:
+            pass
+
+    def reclaim_expired(self):
+        # Releases the items whose worker stopped renewing their lease.
+        now = time.time()
+        for name in self._names("claimed"):
+            try:
+                expired = now - os.stat(self._path("claimed", name)).st_mtime > self.lease
+            except FileNotFoundError:
+                continue
+            if expired:
+                self.release(name, "lease expired")
+
+    def counts(self):
+        return {state: len(self._names(state)) for state in ("pending", "claimed", "done", "failed")}
+
+    def results(self):
+        return [_read_json(self._path("done", name)) for name in self._names("done")]
+
+class Lease:
+    # Renews the lease of a claimed item from a background thread.
+
+    def __init__(self, queue, name):
+        self.queue = queue
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease / 3):
+            self.queue.heartbeat(self.name)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def init(args, queue):
+    if args.seed is None:
+        args.seed = int(np.random.randint(2**31 - 1))
+    config_path = os.path.join(args.queue_dir, "config.json")
+    if not os.path.exists(config_path):
+        _write_json(config_path, {k: v for k, v in vars(args).items() if k not in WORKER_ARGS + QUEUE_ARGS})
+    config = _read_json(config_path)
+    env_names = args.env_names.split(',')
+    costs = estimate_costs(env_names, args)
+    items = []
+    for env_name in env_names:
+        env = make_env(env_name, args)
+        items += [(env_name, eps) for eps in range(env.default_iter)]
+        env.close()
+    added = queue.put([{"llm": llm_name, "env": env_name, "eps": eps} for llm_name in args.llm_name.split(',') for env_name, eps in items],
+                      [costs.get((env_name, eps), 0.0) for llm_name in args.llm_name.split(',') for env_name, eps in items])
+    print("Added {} items, seed {}: {}".format(added, config["seed"], queue.counts()))
+
+def work(args, queue):
+    # Plays items until none is left, in the settings the queue was created with.
+    config = _read_json(os.path.join(args.queue_dir, "config.json"))
+    worker = "{}-{}-{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+    logger = make_logger(args, "worker-{}".format(worker))
+    query_models = {}
+    played = 0
+    try:
+        while True:
+            queue.reclaim_expired()
+            claimed = queue.claim(worker)
+            if claimed is None:
+                if queue.counts()["claimed"] == 0:
+                    break
+                time.sleep(args.poll_interval)  # Others are still playing, their items may come back.
+                continue
+            name, item = claimed
+            eval_args = argparse.Namespace(**dict(config, **{k: getattr(args, k) for k in WORKER_ARGS}, llm_name=item["llm"]))
+            try:
+                if item["llm"] not in query_models:
+                    query_models[item["llm"]] = build_query_model(eval_args)[0]
+                with Lease(queue, name):
+                    random_state = episode_random_state(config["seed"], item["env"], item["eps"])
+                    env = make_env(item["env"], eval_args, random_state)
+                    try:
+                        checkpoints = make_checkpoints(eval_args)
+                        result = run_episode(env, item["env"], env.default_steps, query_models[item["llm"]], random_state,
+                                             logger.episode(item["env"], item["eps"]), eval_args.protocol, eval_args.prompt_layout,
+                                             checkpoints.episode(item["env"], item["eps"]) if checkpoints is not None else None)
+                    finally:
+                        env.close()
+            except Exception:
+                queue.release(name, traceback.format_exc())
+                continue
+            result = dict({k: v for k, v in result.items() if k != "rows"}, llm=item["llm"], env=item["env"], eps=item["eps"], worker=worker)
+            logger.log("episode", item["env"], item["eps"], result)
+            queue.complete(name, result)
+            played += 1
+    finally:
+        logger.close()
+    print("Worker {} played {} items: {}".format(worker, played, queue.counts()))
+
+def merge(queue):
+    # Normalized and capability scores of each LLM, from the finished items.
+    scores = {}
+    for result in queue.results():
+        scores.setdefault(result["llm"], {}).setdefault(result["env"], []).append(result["normalized_score"])
+    merged = {}
+    for llm_name, by_env in sorted(scores.items()):
+        score_dict = {env_name: np.average(values) for env_name, values in by_env.items()}
+        merged[llm_name] = {"scores": score_dict, "capabilities": smartplay.analyze_capabilities(score_dict)}
+        print("LLM", llm_name)
+        print("Normalized scores on each task:", score_dict)
+        print("Capability scores of the LLM:", merged[llm_name]["capabilities"])
+    counts = queue.counts()
+    if counts["pending"] or counts["claimed"] or counts["failed"]:
+        print("Not finished:", counts)
+    return merged
+
+def main(argv=None):
+    parser = get_parser()
+    parser.add_argument('command', choices=['init', 'work', 'merge', 'status'])
+    parser.add_argument('--queue_dir', type=str, required=True, help='Queue directory, shared by all workers')
+    parser.add_argument('--lease', type=float, default=600.0, help='Seconds without a heartbeat after which an item is given to another worker')
+    parser.add_argument('--max_attempts', type=int, default=3, help='Attempts at an item before it is moved to failed/')
+    parser.add_argument('--poll_interval', type=float, default=10.0, help='Seconds between checks for items put back by other workers')
+    args = parse_args(parser, argv)
+    if args.adaptive:
+        parser.error("--adaptive is only supported by experiment.py, which plays the episodes of an environment in order")
+    queue = WorkQueue(args.queue_dir, args.lease, args.max_attempts)
+    if args.command == 'init':
+        init(args, queue)
+    elif args.command == 'work':
+        work(args, queue)
+    elif args.command == 'merge':
+        return merge(queue)
+    else:
+        print(queue.counts())
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,10 @@
 
 import warnings
 import importlib
+import hashlib
+import json
 import os
-import yaml
+from gym.envs.registration import register
 
 
 root_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,10 +17,72 @@ _exclude_path = ['__pycache__', 'utils', 'tests', 'eval', 'example_game']
 _module_dir = os.path.dirname(__file__)
 
 
-for dirname in os.listdir(root_dir):
-    if os.path.isdir(os.path.join(root_dir, dirname)) and dirname not in _exclude_path:
-        if '__init__.py' in os.listdir(os.path.join(root_dir, dirname)):
-            games.append(dirname)
+# The parsed evaluation.yml of every game is cached in an index, valid while
+# the games and their files keep their modification times and sizes. The index
+# lives in __pycache__, or in the user's cache directory if that is read-only.
+_INDEX_VERSION = 1
+
+
+def _index_paths():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return [os.path.join(root_dir, '__pycache__', 'registry_index.json'),
+            os.path.join(cache_dir, 'smartplay', 'registry_index-{}.json'.format(hashlib.sha1(root_dir.encode()).hexdigest()[:12]))]
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _game_stamps(game):
+    return [_stamp(os.path.join(root_dir, game, '__init__.py')), _stamp(os.path.join(root_dir, game, 'evaluation.yml'))]
+
+
+def _load_index():
+    # Returns the parsed evaluation.yml of each game, or None if no index is valid.
+    for path in _index_paths():
+        try:
+            with open(path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if index.get('version') == _INDEX_VERSION and index.get('root') == _stamp(root_dir) \
+                and all(entry['stamps'] == _game_stamps(game) for game, entry in index['games'].items()):
+            return {game: entry['yml'] for game, entry in index['games'].items()}
+    return None
+
+
+def _save_index(ymls):
+    for path in _index_paths():
+        try:
+            # Stamped after creating __pycache__, which changes the stamp of root_dir.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            index = {'version': _INDEX_VERSION, 'root': _stamp(root_dir),
+                     'games': {game: {'stamps': _game_stamps(game), 'yml': yml} for game, yml in ymls.items()}}
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp, path)
+            return
+        except OSError:
+            continue
+
+
+_ymls = _load_index()
+_index_valid = _ymls is not None
+
+
+if _index_valid:
+    games = list(_ymls)
+else:
+    _ymls = {}
+    for dirname in os.listdir(root_dir):
+        if os.path.isdir(os.path.join(root_dir, dirname)) and dirname not in _exclude_path:
+            if '__init__.py' in os.listdir(os.path.join(root_dir, dirname)):
+                games.append(dirname)
 
 
 game_challenges = {}
@@ -28,40 +92,66 @@ recorded_settings = {}
 for game in games:
 
 
-    if not os.path.exists(os.path.join(root_dir, game, 'evaluation.yml')):
-        warnings.warn('Game `{}` does not have evaluation.yml. Skipping the game.'.format(game), UserWarning)
-        continue
+    if game in _ymls:
+        yml = _ymls[game]
+        recorded_setting = yml['recorded settings']
+        game_challenge = yml['challenges']
 
+    else:
 
-    try:
-        # Load evaluation settings
-        with open(os.path.join(root_dir, game, 'evaluation.yml'), 'r') as f:
-            yml = yaml.safe_load(f)
-            recorded_setting = yml['recorded settings']
-            game_challenge = yml['challenges']
+        if not os.path.exists(os.path.join(root_dir, game, 'evaluation.yml')):
+            warnings.warn('Game `{}` does not have evaluation.yml. Skipping the game.'.format(game), UserWarning)
+            continue
+
+        try:
+            # Load evaluation settings
+            import yaml
+            with open(os.path.join(root_dir, game, 'evaluation.yml'), 'r') as f:
+                yml = yaml.safe_load(f)
+                recorded_setting = yml['recorded settings']
+                game_challenge = yml['challenges']
 
-    except Exception as e:
-        warnings.warn('Failed to load `evaluation.yml` for `{}`.'.format(game), UserWarning)
-        continue
+        except Exception as e:
+            warnings.warn('Failed to load `evaluation.yml` for `{}`.'.format(game), UserWarning)
+            continue
 
+        _ymls[game] = yml
+
+
+    if 'environments' in yml:
+        # Register environments from their metadata. The game is only imported
+        # by gym.make, so a missing dependency fails there rather than hiding
+        # the game, and importing smartplay stays fast.
+        environments = []
+        for env_id, spec in yml['environments'].items():
+            register(id=env_id, entry_point=spec['entry point'], kwargs=spec.get('kwargs') or {})
+            environments.append(env_id.rsplit('-', 1))
+
+    else:
+        try:
+            # Games without an environments section list them in their package
+            # as `environments`, and register them on import.
+            module = importlib.import_module("."+game, package='smartplay')
+            environments = getattr(module, 'environments', None)
+        except Exception as e:
+            warnings.warn('Failed to import `{}`. Skipping the game.'.format(game), UserWarning)
+            continue
 
-    try:
-        # Load environments
-        module = importlib.import_module("."+game, package='smartplay')
-        environments = getattr(module, 'environments', None)
-        if environments:
-            for env_name, version in environments:
-                env_list.append('{}-{}'.format(env_name, version))
-                game_challenges[env_name] = game_challenge['all'] if env_name not in game_challenge.keys() else game_challenge[env_name]
-                if env_name in recorded_setting.keys():
-                    recorded_settings[env_name] = recorded_setting[env_name]
-        else:
+        if not environments:
             warnings.warn('Failed to load `{}.environments`. Skipping the game.'.format(game), UserWarning)
             continue
 
-    except Exception as e:
-        warnings.warn('Failed to import `{}`. Skipping the game.'.format(game), UserWarning)
-        continue
+
+    for env_name, version in environments:
+        env_list.append('{}-{}'.format(env_name, version))
+        game_challenges[env_name] = game_challenge['all'] if env_name not in game_challenge.keys() else game_challenge[env_name]
+        if env_name in recorded_setting.keys():
+            recorded_settings[env_name] = recorded_setting[env_name]
+
+
+# Games that failed to load are left out of the index, so they warn again.
+if not _index_valid and len(_ymls) == len(games):
+    _save_index(_ymls)
 
 
 from .eval import *
\ No newline at end of file
@@ -2,7 +2,7 @@ import numpy as np
 import gym
 from gym import spaces
 from gym.utils import seeding
-from ..utils import HistoryTracker, describe_act
+from ..utils import HistoryTracker, Observation, describe_act
 import random
 
 class BanditEnv(gym.Env):
@@ -64,7 +64,9 @@ You are in the casino with 2 slot machines in front of you. Your goal is to try
                 reward = np.random.normal(self.r_dist[action][0], self.r_dist[action][1])
 
         self.score_tracker+=int(action == self.optimal)
-        info = {"obs": "You pulled slot machine {}, you received reward {}.".format(action+1, reward),
+        obs_struct = Observation(action=self.action_list[action], state=(("machine", action+1), ("reward", reward)))
+        info = {"obs": self.describe_observation(obs_struct),
+                "obs_struct": obs_struct,
                 "score": self.score_tracker,
                 "manual": self.desc,
                 "history": self.history.describe(),
@@ -85,7 +87,8 @@ You are in the casino with 2 slot machines in front of you. Your goal is to try
         self.ev = [p*r - (1-p) for p, r in zip(self.p_dist, self.r_dist)]
         self.optimal = np.argmax(self.ev)
         self.history.reset()
-        info = {"obs": "A new round begins.",
+        info = {"obs": self.describe_observation(Observation()),
+                "obs_struct": Observation(),
                 "score": self.score_tracker,
                 "manual": self.desc,
                 "history": self.history.describe(),
@@ -95,6 +98,12 @@ You are in the casino with 2 slot machines in front of you. Your goal is to try
         self.history.step(info)
         return 0, info
 
+    def describe_observation(self, obs):
+        if obs.action is None:
+            return "A new round begins."
+        state = dict(obs.state)
+        return "You pulled slot machine {}, you received reward {}.".format(state["machine"], state["reward"])
+
     def render(self, mode='human', close=False):
         pass
 
@@ -144,7 +144,38 @@ class Textures:
 
 class GlobalView:
 
-  pass
+  # Renders the whole world with one colour per tile, looked up from a
+  # palette of average texture colours, which is much faster than compositing
+  # textures for overview images and thumbnails.
+
+  def __init__(self, world, textures):
+    self._world = world
+    self._textures = textures
+    self._colors = {}
+    self._palette = np.zeros((0, 3), np.uint8)
+
+  def __call__(self, unit=1):
+    names = self._world._mat_names
+    if len(self._palette) != len(names):
+      self._palette = np.array(
+          [self._color(names[i]) for i in range(len(names))], np.uint8)
+    canvas = self._palette[self._world._mat_map]
+    for obj in self._world.objects:
+      canvas[tuple(obj.pos)] = self._color(obj.texture)
+    if unit > 1:
+      canvas = canvas.repeat(unit, 0).repeat(unit, 1)
+    return canvas
+
+  def _color(self, name):
+    if name not in self._colors:
+      image = self._textures.get(name, (16, 16)).astype(np.float32)
+      if image.shape[-1] == 4:
+        alpha = image[..., 3:] / 255
+        color = (alpha * image[..., :3]).sum((0, 1)) / max(alpha.sum(), 1)
+      else:
+        color = image[..., :3].mean((0, 1))
+      self._colors[name] = color.astype(np.uint8)
+    return self._colors[name]
 
 
 class UncoverView:
@@ -263,6 +294,18 @@ class SemanticView:
       canvas[tuple(obj.pos)] = self._obj_ids[type(obj)]
     return canvas
 
+  def capture(self):
+    # Copies only what the semantic map depends on and returns a function that
+    # builds it later, which stays correct after the world has changed.
+    canvas = self._world._mat_map.copy()
+    obj_map = self._world._obj_map.copy()
+    objs = list(self._world._objects)
+    def build():
+      for x, y in zip(*np.nonzero(obj_map)):
+        canvas[x, y] = self._obj_ids[type(objs[obj_map[x, y]])]
+      return canvas
+    return build
+
 
 def _inside(lhs, mid, rhs):
   return (lhs[0] <= mid[0] < rhs[0]) and (lhs[1] <= mid[1] < rhs[1])
@@ -5,6 +5,7 @@ import numpy as np
 from . import constants
 from . import engine
 from . import objects
+from . import worldfile
 from . import worldgen
 
 
@@ -47,6 +48,7 @@ class Env(BaseClass):
     self._sem_view = engine.SemanticView(self._world, [
         objects.Player, objects.Cow, objects.Zombie,
         objects.Skeleton, objects.Arrow, objects.Plant])
+    self._global_view = engine.GlobalView(self._world, self._textures)
     self._step = None
     self._player = None
     self._last_health = None
@@ -80,6 +82,29 @@ class Env(BaseClass):
     worldgen.generate_world(self._world, self._player)
     return self._obs()
 
+  def save(self, filename):
+    worldfile.save(self, filename)
+
+  def load(self, filename):
+    # Starts an episode from a world file written by save(), as an alternative
+    # to reset(). The material map is memory mapped rather than read.
+    worldfile.apply(self, worldfile.load(filename), copy=False)
+    self._update_time()
+    # Rendering at night draws noise from the world's generator, which must
+    # continue from the saved state for the episode to play out the same.
+    state = self._world.random.get_state()
+    obs = self._obs()
+    self._world.random.set_state(state)
+    return obs
+
+  def snapshot(self):
+    # Compact copy of the episode state as arrays, much cheaper than deep
+    # copying the environment. Pass it to restore() to branch the episode.
+    return worldfile.capture(self)
+
+  def restore(self, snapshot):
+    worldfile.apply(self, snapshot)
+
   def step(self, action):
     self._step += 1
     self._update_time()
@@ -105,12 +130,11 @@ class Env(BaseClass):
     dead = self._player.health <= 0
     over = self._length and self._step >= self._length
     done = dead or over
-    info = {
+    info = self._make_info({
         'inventory': self._player.inventory.copy(),
         'achievements': self._player.achievements.copy(),
         'sleeping': self._player.sleeping,
         'discount': 1 - float(dead),
-        'semantic': self._sem_view(),
         'player_pos': self._player.pos,
         'player_facing': self._player.facing,
         'reward': reward,
@@ -118,11 +142,16 @@ class Env(BaseClass):
         'unlocked': unlocked,
         'action': self._player.action,
         'view': self._view,
-    }
+    }, semantic=self._sem_view.capture())
     if not self._reward:
       reward = 0.0
     return obs, reward, done, info
 
+  def _make_info(self, values, **lazy):
+    # Subclasses may keep the lazy entries unevaluated until they are needed.
+    values.update({key: fn() for key, fn in lazy.items()})
+    return values
+
   def render(self, size=None):
     size = size or self._size
     unit = size // self._view
@@ -135,6 +164,9 @@ class Env(BaseClass):
     canvas[x: x + w, y: y + h] = view
     return canvas.transpose((1, 0, 2))
 
+  def render_overview(self, unit=1):
+    return self._global_view(unit).transpose((1, 0, 2))
+
   def _obs(self):
     return self.render()
 
@@ -165,7 +197,11 @@ class Env(BaseClass):
       spawn_prob, despawn_prob, ctor, target_fn):
     xmin, xmax, ymin, ymax = chunk
     random = self._world.random
-    creatures = [obj for obj in objs if isinstance(obj, cls)]
+    # Chunks hold sets, so order creatures by their world index to make the
+    # despawn choice independent of object hashes and thus reproducible.
+    creatures = sorted(
+        (obj for obj in objs if isinstance(obj, cls)),
+        key=lambda obj: self._world._obj_map[tuple(obj.pos)])
     mask = self._world.mask(*chunk, material)
     target_min, target_max = target_fn(len(creatures), mask.sum())
     if len(creatures) < int(target_min) and random.uniform() < spawn_prob:
@@ -0,0 +1,68 @@
+import argparse
+import concurrent.futures
+import os
+import time
+
+import numpy as np
+
+import crafter
+
+
+RESOURCES = ('coal', 'iron', 'diamond', 'water', 'lava')
+CREATURES = ('cow', 'zombie', 'skeleton')
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--start', type=int, default=0)
+  parser.add_argument('--amount', type=int, default=1000)
+  parser.add_argument('--area', nargs=2, type=int, default=(64, 64))
+  parser.add_argument('--workers', type=int, default=os.cpu_count())
+  parser.add_argument('--filename', type=str, default='seeds.npz')
+  args = parser.parse_args()
+
+  start = time.time()
+  seeds = range(args.start, args.start + args.amount)
+  columns = scan(seeds, tuple(args.area), args.workers)
+  np.savez(args.filename, **columns)
+  duration = time.time() - start
+  print(f'Scanned {len(seeds)} seeds in {duration:.1f}s '
+        f'({len(seeds) / duration:.1f} worlds/s)')
+  for name in RESOURCES:
+    print(f'{name.capitalize() + ":":<10} '
+          f'mean {columns[name].mean():>6.1f}, '
+          f'missing in {(columns[name] == 0).sum()} worlds')
+  print('Saved', args.filename)
+
+
+def scan(seeds, area=(64, 64), workers=None):
+  # Each seed matches the first episode of crafter.Env(area, seed=seed). The
+  # worlds are generated without an environment, so nothing is rendered.
+  seeds = list(seeds)
+  chunksize = max(1, len(seeds) // (4 * (workers or os.cpu_count() or 1)))
+  with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+    rows = list(pool.map(
+        _scan_seed, seeds, [area] * len(seeds), chunksize=chunksize))
+  return {key: np.array([row[key] for row in rows]) for key in rows[0]}
+
+
+def _scan_seed(seed, area):
+  world = crafter.engine.World(area, crafter.constants.materials, (12, 12))
+  world.reset(seed=hash((seed, 1)) % (2 ** 31 - 1))
+  player = crafter.objects.Player(world, (area[0] // 2, area[1] // 2))
+  world.add(player)
+  crafter.worldgen.generate_world(world, player)
+  row = {'seed': seed}
+  for name in RESOURCES:
+    xs, ys = np.nonzero(world._mat_map == world._mat_ids[name])
+    row[name] = len(xs)
+    dists = np.abs(xs - player.pos[0]) + np.abs(ys - player.pos[1])
+    row[f'{name}_dist'] = dists.min() if len(dists) else -1
+  kinds = [type(obj).__name__.lower() for obj in world.objects]
+  for name in CREATURES:
+    row[name] = kinds.count(name)
+  return row
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,60 @@
+import argparse
+import copy
+import time
+
+import numpy as np
+
+import crafter
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--seed', type=int, default=None)
+  parser.add_argument('--area', nargs=2, type=int, default=(64, 64))
+  parser.add_argument('--warmup', type=int, default=200)
+  parser.add_argument('--repeats', type=int, default=200)
+  parser.add_argument('--branch', type=int, default=50)
+  args = parser.parse_args()
+
+  random = np.random.RandomState(args.seed)
+  env = crafter.Env(area=args.area, seed=args.seed)
+  env.reset()
+  for _ in range(args.warmup):
+    _, _, done, _ = env.step(random.randint(0, env.action_space.n))
+    if done:
+      env.reset()
+  print('Objects in world:', len(env._world.objects))
+
+  start = time.time()
+  for _ in range(args.repeats):
+    snapshot = env.snapshot()
+  duration = (time.time() - start) / args.repeats
+  print(f'Snapshot time: {1e6*duration:.0f}us')
+
+  start = time.time()
+  for _ in range(args.repeats):
+    env.restore(snapshot)
+  duration = (time.time() - start) / args.repeats
+  print(f'Restore time:  {1e6*duration:.0f}us')
+
+  start = time.time()
+  for _ in range(max(1, args.repeats // 10)):
+    copy.deepcopy(env._world)
+  duration = (time.time() - start) / max(1, args.repeats // 10)
+  print(f'Deepcopy time: {1e6*duration:.0f}us (world only)')
+
+  # Branching twice from the same snapshot must replay identically.
+  actions = random.randint(0, env.action_space.n, args.branch)
+  semantics = []
+  for _ in range(2):
+    env.restore(snapshot)
+    for action in actions:
+      _, _, done, info = env.step(action)
+      if done:
+        break
+    semantics.append(info['semantic'])
+  print('Branches identical:', bool((semantics[0] == semantics[1]).all()))
+
+
+if __name__ == '__main__':
+  main()
@@ -14,12 +14,23 @@ def main():
   parser.add_argument('--area', nargs=2, type=int, default=(64, 64))
   parser.add_argument('--size', type=int, default=1024)
   parser.add_argument('--filename', type=str, default='terrain.png')
+  parser.add_argument('--renderer', type=str, default='texture', choices=[
+      'texture', 'palette'])
   args = parser.parse_args()
 
-  env = crafter.Env(args.area, args.area, args.size, seed=args.seed)
+  if args.renderer == 'palette':
+    # Only the small local view is rendered on reset, the overview comes from
+    # a per-tile colour lookup upscaled to roughly the requested size.
+    env = crafter.Env(args.area, seed=args.seed)
+    unit = max(1, args.size // max(args.area))
+  else:
+    env = crafter.Env(args.area, args.area, args.size, seed=args.seed)
   images = []
   for index in range(args.amount):
-    images.append(env.reset())
+    image = env.reset()
+    if args.renderer == 'palette':
+      image = env.render_overview(unit)
+    images.append(image)
     diamonds = env._world.count('diamond')
     print(f'Map: {index:>2}, diamonds: {diamonds:>2}')
 
@@ -0,0 +1,228 @@
+import collections
+import mmap
+import struct
+
+import numpy as np
+
+from . import constants
+from . import objects
+
+
+# Binary layout, all little-endian and every section padded to 8 bytes:
+#   header          HEADER struct
+#   materials       material names separated by null bytes
+#   rng keys        624 x uint32 Mersenne Twister state
+#   player          1 x PLAYER_DTYPE
+#   material map    area[0] x area[1] x uint8
+#   objects         num_objects x OBJECT_DTYPE
+#   chunks          num_chunks x 4 x int16 chunk keys in iteration order
+MAGIC = b'CRFW'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHIIIIIIqdIid')
+
+KINDS = (
+    objects.Player, objects.Cow, objects.Zombie, objects.Skeleton,
+    objects.Arrow, objects.Plant, objects.Fence)
+
+OBJECT_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('facing', 'i1', (2,)),
+    ('pos', '<i2', (2,)),
+    ('health', '<i4'),
+    # Zombie cooldown, skeleton reload or plant growth.
+    ('counter', '<i4'),
+])
+
+PLAYER_DTYPE = np.dtype([
+    ('inventory', '<i4', (len(constants.items),)),
+    ('achievements', '<i4', (len(constants.achievements),)),
+    ('unlocked', '?', (len(constants.achievements),)),
+    ('sleeping', '?'),
+    ('last_health', '<i4'),
+    ('env_last_health', '<i4'),
+    ('hunger', '<f4'),
+    ('thirst', '<f4'),
+    ('fatigue', '<f4'),
+    ('recover', '<f4'),
+])
+
+RNG_KEYS = 624
+
+
+WorldState = collections.namedtuple('WorldState', (
+    'area, step, episode, seed, daylight, materials, rng, player, '
+    'mat_map, objects, chunks'))
+
+
+def capture(env):
+  world = env._world
+  player = env._player
+  rows = []
+  for obj in world.objects:
+    facing, counter = (0, 0), 0
+    if isinstance(obj, (objects.Player, objects.Arrow)):
+      facing = tuple(obj.facing)
+    if isinstance(obj, objects.Zombie):
+      counter = obj.cooldown
+    elif isinstance(obj, objects.Skeleton):
+      counter = obj.reload
+    elif isinstance(obj, objects.Plant):
+      counter = obj.grown
+    rows.append((
+        KINDS.index(type(obj)), facing, tuple(obj.pos), obj.health, counter))
+  table = np.array(rows, OBJECT_DTYPE)
+  stats = np.zeros((), PLAYER_DTYPE)
+  stats['inventory'] = [player.inventory[k] for k in constants.items]
+  stats['achievements'] = [
+      player.achievements[k] for k in constants.achievements]
+  stats['unlocked'] = [k in env._unlocked for k in constants.achievements]
+  stats['sleeping'] = player.sleeping
+  stats['last_health'] = player._last_health
+  stats['env_last_health'] = env._last_health
+  stats['hunger'] = player._hunger
+  stats['thirst'] = player._thirst
+  stats['fatigue'] = player._fatigue
+  stats['recover'] = player._recover
+  _, keys, pos, has_gauss, gauss = world.random.get_state()
+  materials = tuple(world._mat_names[i] for i in range(len(world._mat_names)))
+  return WorldState(
+      tuple(world.area), env._step, env._episode, env._seed, world.daylight,
+      materials, (keys.copy(), pos, has_gauss, gauss), stats,
+      world._mat_map.copy(), table,
+      np.array(list(world._chunks.keys()), '<i2').reshape((-1, 4)))
+
+
+def apply(env, state, copy=True):
+  world = env._world
+  if tuple(state.area) != tuple(world.area):
+    raise ValueError(
+        f'World area {tuple(state.area)} does not match the environment '
+        f'area {tuple(world.area)}.')
+  current = tuple(world._mat_names[i] for i in range(len(world._mat_names)))
+  if state.materials != current[:len(state.materials)]:
+    raise ValueError('World materials do not match the environment.')
+  # Clear the world like World.reset() but keep the random state object, as
+  # creating a new one is slower than everything else here.
+  world._chunks = collections.defaultdict(set)
+  world._objects = [None]
+  world._obj_map = np.zeros(world.area, np.uint32)
+  # Chunks are balanced in insertion order, which consumes random numbers, so
+  # the order is restored before any object is added.
+  for chunk in state.chunks:
+    world._chunks[tuple(int(x) for x in chunk)]
+  keys, pos, has_gauss, gauss = state.rng
+  world.random.set_state(('MT19937', keys, pos, has_gauss, gauss))
+  world.daylight = state.daylight
+  world._mat_map = np.array(state.mat_map, copy=copy)
+  env._step = state.step
+  env._episode = state.episode
+  env._seed = state.seed
+  stats = state.player
+  player_row = state.objects[state.objects['kind'] == 0][0]
+  player = objects.Player(world, player_row['pos'].astype(np.int64))
+  player.inventory = {
+      k: int(v) for k, v in zip(constants.items, stats['inventory'])}
+  player.achievements = {
+      k: int(v) for k, v in zip(constants.achievements, stats['achievements'])}
+  player.facing = tuple(int(x) for x in player_row['facing'])
+  player.sleeping = bool(stats['sleeping'])
+  player._last_health = int(stats['last_health'])
+  player._hunger = float(stats['hunger'])
+  player._thirst = float(stats['thirst'])
+  player._fatigue = float(stats['fatigue'])
+  player._recover = float(stats['recover'])
+  env._player = player
+  env._last_health = int(stats['env_last_health'])
+  env._unlocked = {
+      k for k, v in zip(constants.achievements, stats['unlocked']) if v}
+  # Objects are inserted in bulk rather than through world.add(), keeping
+  # their order and thus the order in which they are updated.
+  table = state.objects.tolist()
+  for kind, facing, pos, health, counter in table:
+    cls = KINDS[kind]
+    if cls is objects.Player:
+      obj = player
+    elif cls in (objects.Zombie, objects.Skeleton):
+      obj = cls(world, pos, player)
+    elif cls is objects.Arrow:
+      obj = cls(world, pos, tuple(facing))
+    else:
+      obj = cls(world, pos)
+    if cls is not objects.Player:
+      obj.health = health
+    if cls is objects.Zombie:
+      obj.cooldown = counter
+    elif cls is objects.Skeleton:
+      obj.reload = counter
+    elif cls is objects.Plant:
+      obj.grown = counter
+    world._objects.append(obj)
+    world._chunks[world.chunk_key(obj.pos)].add(obj)
+  if table:
+    xs, ys = state.objects['pos'].T
+    world._obj_map[xs, ys] = np.arange(1, len(table) + 1)
+
+
+def save(env, filename):
+  state = capture(env)
+  materials = b'\0'.join(
+      (name or '').encode('utf-8') for name in state.materials)
+  keys, pos, has_gauss, gauss = state.rng
+  header = HEADER.pack(
+      MAGIC, VERSION, state.area[0], state.area[1], len(state.materials),
+      len(materials), len(state.objects), len(state.chunks), state.step,
+      state.episode, state.seed, state.daylight, pos, has_gauss, gauss)
+  sections = [
+      header, materials, keys.astype('<u4').tobytes(),
+      state.player.tobytes(), np.ascontiguousarray(state.mat_map).tobytes(),
+      state.objects.tobytes(), state.chunks.tobytes()]
+  with open(filename, 'wb') as f:
+    for section in sections:
+      f.write(section)
+      f.write(b'\0' * _padding(len(section)))
+
+
+def load(filename):
+  # The mapping is private, so the environment can modify the material map
+  # in place without copying it upfront or writing back to the file.
+  with open(filename, 'rb') as f:
+    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+  (magic, version, width, height, num_materials, materials_size,
+   num_objects, num_chunks, step, episode, seed, daylight, pos, has_gauss,
+   gauss) = HEADER.unpack_from(buffer, 0)
+  if magic != MAGIC:
+    raise ValueError(f'File {filename} is not a Crafter world file.')
+  if version != VERSION:
+    raise ValueError(
+        f'Unsupported world file version {version}, expected {VERSION}.')
+  offset = _aligned(HEADER.size)
+  materials = bytes(buffer[offset: offset + materials_size])
+  materials = tuple(
+      name or None for name in materials.decode('utf-8').split('\0'))
+  if len(materials) != num_materials:
+    raise ValueError(
+        f'File {filename} lists {len(materials)} materials, expected '
+        f'{num_materials}.')
+  offset = _aligned(offset + materials_size)
+  keys = np.frombuffer(buffer, '<u4', RNG_KEYS, offset)
+  offset = _aligned(offset + keys.nbytes)
+  player = np.frombuffer(buffer, PLAYER_DTYPE, 1, offset)[0]
+  offset = _aligned(offset + PLAYER_DTYPE.itemsize)
+  mat_map = np.frombuffer(
+      buffer, np.uint8, width * height, offset).reshape((width, height))
+  offset = _aligned(offset + mat_map.nbytes)
+  table = np.frombuffer(buffer, OBJECT_DTYPE, num_objects, offset)
+  offset = _aligned(offset + table.nbytes)
+  chunks = np.frombuffer(
+      buffer, '<i2', 4 * num_chunks, offset).reshape((num_chunks, 4))
+  return WorldState(
+      (width, height), step, episode, seed, daylight, materials,
+      (keys, pos, has_gauss, gauss), player, mat_map, table, chunks)
+
+
+def _aligned(size):
+  return size + _padding(size)
+
+
+def _padding(size):
+  return -size % 8
@@ -1,31 +1,36 @@
 import gym
 from gym import error, spaces, utils
 from gym.utils import seeding
-from ..utils import HistoryTracker
-from .crafter import Env
+from ..utils import Entity, HistoryTracker, LazyInfo, Observation, describe_changes
+from .crafter import Env, constants, objects
 import numpy as np
 
-id_to_item = [0]*19
-import itertools
-dummyenv = Env()
-for name, ind in itertools.chain(dummyenv._world._mat_ids.items(), dummyenv._sem_view._obj_ids.items()):
-    name = str(name)[str(name).find('objects.')+len('objects.'):-2].lower() if 'objects.' in str(name) else str(name)
-    id_to_item[ind] = name
+# Names of the ids of the semantic map: the materials of the world, then the
+# objects in the order of the SemanticView of crafter's Env.
+id_to_item = [str(name) for name in [None] + constants.materials] + [
+    cls.__name__.lower() for cls in [objects.Player, objects.Cow, objects.Zombie, objects.Skeleton, objects.Arrow, objects.Plant]]
 player_idx = id_to_item.index('player')
-del dummyenv
 
 vitals = ["health","food","drink","energy",]
 
+# Info entries observe() reads. Lazy observations keep only these, not the
+# whole info, whose history would keep every earlier step alive.
+observed_fields = ('semantic', 'player_pos', 'player_facing', 'view', 'action', 'sleeping', 'dead', 'inventory')
+
 rot = np.array([[0,-1],[1,0]])
 directions = ['front', 'right', 'back', 'left']
 
 def describe_inventory(info):
+    return describe_items(info['inventory'])
+
+
+def describe_items(inventory):
     result = ""
     
-    status_str = "Your status:\n{}".format("\n".join(["- {}: {}/9".format(v, info['inventory'][v]) for v in vitals]))
+    status_str = "Your status:\n{}".format("\n".join(["- {}: {}/9".format(v, inventory[v]) for v in vitals]))
     result += status_str + "\n\n"
     
-    inventory_str = "\n".join(["- {}: {}".format(i, num) for i,num in info['inventory'].items() if i not in vitals and num!=0])
+    inventory_str = "\n".join(["- {}: {}".format(i, num) for i,num in inventory.items() if i not in vitals and num!=0])
     inventory_str = "Your inventory:\n{}".format(inventory_str) if inventory_str else "You have nothing in your inventory."
     result += inventory_str #+ "\n\n"
     
@@ -54,32 +59,47 @@ def describe_loc(ref, P):
     return "-".join(desc)
 
 
-def describe_env(info):
+def visible_objects(info):
+    # Nearest tile of each kind in view as Entity records, and the kind of
+    # tile the player faces.
     assert(info['semantic'][info['player_pos'][0],info['player_pos'][1]] == player_idx)
     semantic = info['semantic'][info['player_pos'][0]-info['view'][0]//2:info['player_pos'][0]+info['view'][0]//2+1, info['player_pos'][1]-info['view'][1]//2+1:info['player_pos'][1]+info['view'][1]//2]
     center = np.array([info['view'][0]//2,info['view'][1]//2-1])
-    result = ""
     x = np.arange(semantic.shape[1])
     y = np.arange(semantic.shape[0])
     x1, y1 = np.meshgrid(x,y)
     loc = np.stack((y1, x1),axis=-1)
     dist = np.absolute(center-loc).sum(axis=-1)
-    obj_info_list = []
+    entities = []
     
     facing = info['player_facing']
     target = (center[0] + facing[0], center[1] + facing[1])
     target = id_to_item[semantic[target]]
-    obs = "You face {} at your front.".format(target, describe_loc(np.array([0,0]),facing))
     
     for idx in np.unique(semantic):
         if idx==player_idx:
             continue
 
         smallest = np.unravel_index(np.argmin(np.where(semantic==idx, dist, np.inf)), semantic.shape)
-        obj_info_list.append((id_to_item[idx], dist[smallest], describe_loc(np.array([0,0]), smallest-center)))
+        entities.append(Entity(id_to_item[idx], int(dist[smallest]), describe_loc(np.array([0,0]), smallest-center)))
+
+    return tuple(entities), target
+
 
-    if len(obj_info_list)>0:
-        status_str = "You see:\n{}".format("\n".join(["- {} {} steps to your {}".format(name, dist, loc) for name, dist, loc in obj_info_list]))
+def describe_env(info):
+    return describe_entities(*visible_objects(info))
+
+
+def describe_entity(entity):
+    return "{} steps to your {}".format(entity.distance, entity.direction)
+
+
+def describe_entities(entities, target):
+    result = ""
+    obs = "You face {} at your front.".format(target)
+
+    if len(entities)>0:
+        status_str = "You see:\n{}".format("\n".join(["- {} {}".format(entity.kind, describe_entity(entity)) for entity in entities]))
     else:
         status_str = "You see nothing away from you."
     result += status_str + "\n\n"
@@ -89,52 +109,112 @@ def describe_env(info):
 
 
 def describe_act(info):
-    result = ""
-    
+    return "You took action {}.".format(action_name(info))
+
+
+def action_name(info):
     action_str = info['action'].replace('do_', 'interact_')
     action_str = action_str.replace('move_up', 'move_north')
     action_str = action_str.replace('move_down', 'move_south')
     action_str = action_str.replace('move_left', 'move_west')
     action_str = action_str.replace('move_right', 'move_east')
-    
-    act = "You took action {}.".format(action_str) 
-    result+= act
-    
-    return result.strip()
+    return action_str
 
 
 def describe_status(info):
+    return describe_conditions(conditions(info))
+
+
+def conditions(info):
     if info['sleeping']:
-        return "You are sleeping, and will not be able take actions until energy is full.\n\n"
+        return ("sleeping",)
     elif info['dead']:
+        return ("dead",)
+    else:
+        return ()
+
+
+def describe_conditions(status):
+    if "sleeping" in status:
+        return "You are sleeping, and will not be able take actions until energy is full.\n\n"
+    elif "dead" in status:
         return "You died.\n\n"
     else:
         return ""
 
+
+def observe(info, action):
+    # Structured observation the text of describe_frame is rendered from.
+    entities, target = visible_objects(info)
+    return Observation(
+        action=action_name(info) if action is not None else None,
+        status=conditions(info),
+        entities=entities,
+        facing=target,
+        inventory=tuple(info['inventory'].items()),
+    )
+
     
 def describe_frame(info, action):
     try:
-        result = ""
-        
-        if action is not None:
-            result+=describe_act(info)
-        result+=describe_status(info)
-        result+="\n\n"
-        result+=describe_env(info)
-        result+="\n\n"
-        result+=describe_inventory(info)
-        
-        return result.strip()
+        return describe_observation(observe(info, action))
     except:
         return "Error, you are out of the map."
 
+
+def describe_observation(obs):
+    if obs is None:
+        return "Error, you are out of the map."
+    result = ""
+    
+    if obs.action is not None:
+        result+="You took action {}.".format(obs.action)
+    result+=describe_conditions(obs.status)
+    result+="\n\n"
+    result+=describe_entities(obs.entities, obs.facing)
+    result+="\n\n"
+    result+=describe_items(dict(obs.inventory))
+    
+    return result.strip()
+
+
+def describe_observation_delta(previous, obs):
+    # Like describe_observation, but only reports what changed since `previous`.
+    if previous is None or obs is None:
+        return describe_observation(obs)
+    result = ""
+
+    if obs.action is not None:
+        result+="You took action {}.".format(obs.action)
+    result+=describe_conditions(obs.status)
+    result+="\n\n"
+
+    changes = describe_changes(
+        {entity.kind: describe_entity(entity) for entity in previous.entities},
+        {entity.kind: describe_entity(entity) for entity in obs.entities})
+    result+="Changes in what you see:\n{}".format("\n".join(changes)) if changes else "What you see did not change."
+    if previous.facing != obs.facing:
+        result+="\n\nYou face {} at your front.".format(obs.facing)
+    result+="\n\n"
+
+    changes = describe_changes(dict(previous.inventory), dict(obs.inventory))
+    result+="Changes in your status and inventory:\n{}".format("\n".join(changes)) if changes else "Your status and inventory did not change."
+
+    return result.strip()
+
+
 class Crafter(Env):
 
     default_iter = 10
     default_steps = 10000
+    # Steps draw from the world's own generator, never the global ones.
+    global_random = False
 
-    def __init__(self, area=(64, 64), view=(9, 9), size=(64, 64), reward=True, length=10000, seed=None, max_steps=2):
+    def __init__(self, area=(64, 64), view=(9, 9), size=(64, 64), reward=True, length=10000, seed=None, max_steps=2, delta=False):
         self.history = HistoryTracker(max_steps)
+        # Observations only report changes since the previous step if set.
+        self.delta = delta
+        self._last_obs = None
         self.action_list = ["Noop", "Move West", "Move East", "Move North", "Move South", "Do", \
     "Sleep", "Place Stone", "Place Table", "Place Furnace", "Place Plant", \
     "Make Wood Pickaxe", "Make Stone Pickaxe", "Make Iron Pickaxe", "Make Wood Sword", \
@@ -153,18 +233,25 @@ class Crafter(Env):
         self.score_tracker = 0
         super().__init__(area, view, size, reward, length, seed)
 
-    def reset(self):
+    def reset(self, world=None):
+        # `world` optionally names a file written by `save` to start from.
         self.history.reset()
-        super().reset()
+        self._last_obs = None
+        if world is None:
+            super().reset()
+        else:
+            super().load(world)
         obs, reward, done, info = self.step(0)
         self.score_tracker = 0 + sum([1. for k,v in info['achievements'].items() if v>0])
         info.update({'manual': self.desc,
-                'obs': describe_frame(info, None),
-                'history': self.history.describe(),
                 'score': self.score_tracker,
                 'done': done,
                 'completed': 0,
                 })
+        fields = info.project(observed_fields)
+        struct = info.set_lazy('obs_struct', lambda: self._observe(fields, None))
+        info.set_lazy('obs', lambda: describe_observation(struct()))
+        info.set_lazy('history', self.history.deferred_describe())
         self.history.step(info)
         return obs, info
     
@@ -172,11 +259,41 @@ class Crafter(Env):
         obs, reward, done, info = super().step(action)
         self.score_tracker = self.score_tracker + sum([1. for k,v in info['achievements'].items() if v>0])
         info.update({'manual': self.desc,
-                'obs': describe_frame(info, self.action_list[action]),
-                'history': self.history.describe(),
                 'score': self.score_tracker,
                 'done': done,
                 'completed': 0,
                 })
+        # The text observation and history are only rendered when accessed, so
+        # consumers that only need rewards skip the text work entirely.
+        if self.delta:
+            # The previous observation is kept rather than its info, so that
+            # infos don't keep their predecessors alive.
+            previous, current = self._last_obs, self._observe(info, action)
+            self._last_obs = current
+            info['obs_struct'] = current
+            info.set_lazy('obs', lambda: describe_observation_delta(previous, current))
+        else:
+            fields = info.project(observed_fields)
+            struct = info.set_lazy('obs_struct', lambda: self._observe(fields, action))
+            info.set_lazy('obs', lambda: describe_observation(struct()))
+        info.set_lazy('history', self.history.deferred_describe())
         self.history.step(info)
         return obs, reward, done, info
+
+    def _make_info(self, values, **lazy):
+        return LazyInfo(values, **lazy)
+
+    @staticmethod
+    def _observe(info, action):
+        try:
+            return observe(info, action)
+        except:
+            return None
+
+    def snapshot(self):
+        return super().snapshot(), self.history.snapshot(), self.score_tracker, self._last_obs
+
+    def restore(self, snapshot):
+        state, history, self.score_tracker, self._last_obs = snapshot
+        super().restore(state)
+        self.history.restore(history)
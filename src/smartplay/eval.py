@@ -13,6 +13,7 @@ benchmark_games_v0 = [
 from . import recorded_settings, game_challenges
 import pandas as pd
 import numpy as np
+from statistics import NormalDist
 
 
 def normalize_score(game_name, score):
@@ -43,4 +44,31 @@ def analyze_capabilities(score_dict):
     normalized_scores = np.array(list(score_dict.values())).reshape(-1, 1)
     scores = (challenges_df.values @ normalized_scores).squeeze() / np.sum(challenges_df.values, axis=1)
 
-    return dict(zip(challenges_df.index, scores.flatten()))
\ No newline at end of file
+    return dict(zip(challenges_df.index, scores.flatten()))
+
+def score_interval(scores, confidence=0.95, method='bootstrap', n_resamples=2000, seed=0):
+    # Confidence interval of the mean of the normalized scores of the episodes
+    # played so far, as (low, high).
+    # 'bootstrap' resamples the scores, and 'wilson' treats the mean as a
+    # proportion, which requires scores in [0, 1].
+
+    scores = np.asarray(scores, dtype=float)
+    n = len(scores)
+    if n == 0:
+        return (-np.inf, np.inf)
+
+    if method == 'bootstrap':
+        rng = np.random.default_rng(seed)
+        means = scores[rng.integers(0, n, size=(n_resamples, n))].mean(axis=1)
+        alpha = (1 - confidence) / 2
+        return tuple(np.quantile(means, [alpha, 1 - alpha]))
+    elif method == 'wilson':
+        if scores.min() < 0 or scores.max() > 1:
+            raise ValueError('Wilson intervals require scores in [0, 1], use the bootstrap instead.')
+        z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+        p = scores.mean()
+        center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+        half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+        return (center - half_width, center + half_width)
+    else:
+        raise ValueError('Unknown interval method `{}`.'.format(method))
@@ -1,7 +1,7 @@
 import gym
 from gym import error, spaces, utils
 from gym.utils import seeding
-from ..utils import HistoryTracker, describe_act
+from ..utils import HistoryTracker, Observation, describe_act, describe_changes
 
 import random
 import itertools
@@ -14,8 +14,11 @@ class HanoiEnv(gym.Env):
     default_iter = 10
     default_steps = 30
 
-    def __init__(self, max_steps=5, num_disks=4, env_noise=0):
+    def __init__(self, max_steps=5, num_disks=4, env_noise=0, delta=False):
         self.num_disks = num_disks
+        # Observations only list the rods that changed if set.
+        self.delta = delta
+        self._last_obs = None
         self.env_noise = env_noise
         self.action_space = spaces.Discrete(6)
         self.observation_space = spaces.Tuple(self.num_disks*(spaces.Discrete(3),))
@@ -119,7 +122,9 @@ with top on the right and bottom on the left
         info["state"] = (self.disks_on_peg(0), self.disks_on_peg(1), self.disks_on_peg(2))
         info["score"] = len(self.disks_on_peg(2))
         info["manual"] = self.desc
-        info["obs"] = self.describe_state(info, action)
+        info["obs_struct"] = self.observe(info, action)
+        info["obs"] = self.describe_observation(info["obs_struct"], self._last_obs if self.delta else None)
+        self._last_obs = info["obs_struct"]
         info["history"] = self.history.describe()
         info["completed"] = 0 if not self.done else 1
         self.history.step(info)
@@ -127,13 +132,36 @@ with top on the right and bottom on the left
         return self.current_state, reward, self.done, info
 
     def describe_state(self, state, action=None):
+        return self.describe_observation(self.observe(state, action))
+
+    def observe(self, state, action=None):
+        # Structured observation, with the disks on each rod from bottom to top.
         index = ['A', 'B', 'C']
-        if action is not None:
-            result = "You tried to {}. Current configuration:".format(self.action_list[action].lower())
+        return Observation(
+            action=self.action_list[action] if action is not None else None,
+            state=tuple((index[i], tuple(state['state'][i][::-1])) for i in range(3)),
+        )
+
+    def describe_observation(self, obs, previous=None):
+        if previous is not None:
+            return self.describe_observation_delta(obs, previous)
+        if obs.action is not None:
+            result = "You tried to {}. Current configuration:".format(obs.action.lower())
         else:
             result = "Current configuration:"
-        for i in range(3):
-            result += "\n- {}: |bottom, {}, top|".format(index[i], state['state'][i][::-1])
+        for rod, disks in obs.state:
+            result += "\n- {}: |bottom, {}, top|".format(rod, list(disks))
+        return result.strip()
+
+    def describe_observation_delta(self, obs, previous):
+        # Like describe_observation, but only lists the rods that changed.
+        describe_rods = lambda rods: {rod: "|bottom, {}, top|".format(list(disks)) for rod, disks in rods}
+        changes = describe_changes(describe_rods(previous.state), describe_rods(obs.state))
+        result = "You tried to {}.".format(obs.action.lower())
+        if changes:
+            result += " Changed rods:\n{}".format("\n".join(changes))
+        else:
+            result += " The configuration did not change."
         return result.strip()
 
     def disks_on_peg(self, peg):
@@ -172,7 +200,9 @@ with top on the right and bottom on the left
         info = {"state":(self.disks_on_peg(0), self.disks_on_peg(1), self.disks_on_peg(2))}
         info["score"] = len(self.disks_on_peg(2))
         info["manual"] = self.desc
-        info["obs"] = self.describe_state(info)
+        info["obs_struct"] = self.observe(info)
+        info["obs"] = self.describe_observation(info["obs_struct"])
+        self._last_obs = info["obs_struct"]
         info["history"] = self.history.describe()
         info["completed"] = 0
         self.history.step(info)
@@ -222,10 +252,10 @@ with top on the right and bottom on the left
 
 class Hanoi3Disk(HanoiEnv):
     """Basic 3 disk Hanoi Environment"""
-    def __init__(self):
-        HanoiEnv.__init__(self, num_disks=3)
+    def __init__(self, **kwargs):
+        HanoiEnv.__init__(self, num_disks=3, **kwargs)
 
 class Hanoi4Disk(HanoiEnv):
     """Basic 4 disk Hanoi Environment"""
-    def __init__(self):
-        HanoiEnv.__init__(self, num_disks=4)
+    def __init__(self, **kwargs):
+        HanoiEnv.__init__(self, num_disks=4, **kwargs)
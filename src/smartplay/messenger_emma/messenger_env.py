@@ -1,7 +1,7 @@
 import gym
 from gym import error, spaces, utils
 from gym.utils import seeding
-from ..utils import HistoryTracker, describe_act
+from ..utils import Entity, HistoryTracker, Observation, describe_act, describe_changes
 
 import random
 import itertools
@@ -41,48 +41,91 @@ def describe_loc(ref, P):
     return "-".join(desc)
 
     
-def describe_frame(info):
+conditions = {
+    "without the message": "You (agent) don't have the message.",
+    "with the message": "You (agent) already have the message.",
+}
 
+def visible_entities(info):
+    # Message status of the agent, and each entity as an Entity record.
     if 15 in np.unique(info['avatar']):
-        obs = "You (agent) don't have the message."
+        status = "without the message"
         agent = 15
     elif 16 in np.unique(info['avatar']):
-        obs = "You (agent) already have the message."
+        status = "with the message"
         agent = 16
     else:
         print(np.unique(info['avatar']))
         raise NotImplemented("Problem with agent")
     center = np.array(np.where(info['avatar'].squeeze() == agent)).squeeze()
     info = info['entities']
-    result = ""
     x = np.arange(info.shape[1])
     y = np.arange(info.shape[0])
     x1, y1 = np.meshgrid(x,y)
     loc = np.stack((y1, x1),axis=-1)
     dist = np.absolute(center-loc).sum(axis=-1)[:,:,np.newaxis]
 
-    obj_info_list = []
+    entities = []
     
     
     for idx in np.unique(info):
         if idx == 15 or idx == 0:
             continue
         smallest = np.unravel_index(np.argmin(np.where(info==idx, dist, np.inf)), info.shape)
-        obj_info_list.append((describe_block(idx), dist[smallest[:2]][0], describe_loc(np.array([0,0]), smallest[:2]-center)))
+        entities.append(Entity(describe_block(idx), int(dist[smallest[:2]][0]), describe_loc(np.array([0,0]), smallest[:2]-center)))
+
+    return status, tuple(entities)
+
+
+def observe(info, action=None):
+    # Structured observation the text of describe_frame is rendered from.
+    status, entities = visible_entities(info)
+    return Observation(action=action, status=(status,), entities=entities)
+
+
+def describe_entity(entity):
+    return "{} steps to your {}".format(entity.distance, entity.direction) if entity.distance>0 else "0 steps with you"
+
+
+def describe_frame(info):
+    return describe_observation(observe(info))
 
-    if len(obj_info_list)>0:
-        status_str = "You see:\n{}".format("\n".join(["- {} {} steps to your {}".format(name, dist, loc) if dist>0 else "- {} 0 steps with you".format(name) for name, dist, loc in obj_info_list]))
+
+def describe_observation(obs):
+    result = ""
+
+    if len(obs.entities)>0:
+        status_str = "You see:\n{}".format("\n".join(["- {} {}".format(entity.kind, describe_entity(entity)) for entity in obs.entities]))
     else:
         status_str = "You see nothing away from you."
-    result += obs.strip() + "\n\n" + status_str.strip()
+    result += conditions[obs.status[0]] + "\n\n" + status_str.strip()
+    if obs.action is not None:
+        result = "You took action {}.\n\n{}".format(obs.action, result.strip())
     
     return result.strip()
 
+
+def describe_observation_delta(previous, obs):
+    # Like describe_observation, but only reports what changed since `previous`.
+    result = ""
+    if previous.status != obs.status:
+        result += conditions[obs.status[0]] + "\n\n"
+    changes = describe_changes(
+        {entity.kind: describe_entity(entity) for entity in previous.entities},
+        {entity.kind: describe_entity(entity) for entity in obs.entities})
+    if changes:
+        result += "Changes in what you see:\n{}".format("\n".join(changes))
+    else:
+        result += "What you see did not change."
+    if obs.action is not None:
+        result = "You took action {}.\n\n{}".format(obs.action, result.strip())
+    return result.strip()
+
 class MessengerEnv(gym.Env):
     default_iter = 100
     default_steps = None
 
-    def __init__(self, lvl=1, max_steps=2, env_noise=0):
+    def __init__(self, lvl=1, max_steps=2, env_noise=0, delta=False):
 
         lvl_to_steps = [4, 64, 128]
         self.default_steps = lvl_to_steps[lvl-1]
@@ -91,6 +134,9 @@ class MessengerEnv(gym.Env):
         self.action_list = ["Move North", "Move South", "Move West", "Move East", "Do Nothing"]
 
         self.history = HistoryTracker(max_steps)
+        # Observations only report changes since the previous step if set.
+        self.delta = delta
+        self._last_obs = None
         self.game_context = """In the game, MESSENGER, each entity can take on one of three roles: an enemy, message, or goal. The agent’s objective is to bring the message to the goal while avoiding the enemies. If the agent encounters an enemy at any point in the game, or the goal without first obtaining the message, it loses the game and obtains a reward of −1.""".strip()
         self.advice = """To solve a game, you may find it helpful to list the objects that you see. Then for each object, match it with an entity description, and identify whether it is good or bad to interact with the object.
 The name specifications of in-game objects may not be exact matches. Please try identifying with synonyms.
@@ -100,17 +146,26 @@ The name specifications of in-game objects may not be exact matches. Please try
         self.desc = "{}\n\n{}\n\n{}\n\n{}".format(self.game_context, "\n".join(manual), self.advice, describe_act(self.action_list)).strip()
 
     def describe(self, obs, action=None):
-        if action is not None:
-            return "You took action {}.\n\n{}".format(self.action_list[action], describe_frame(obs))
-        else:
-            return describe_frame(obs)
+        return self._describe_next(self.observe(obs, action))
+
+    def observe(self, obs, action=None):
+        return observe(obs, self.action_list[action] if action is not None else None)
+
+    def _describe_next(self, struct):
+        previous, self._last_obs = self._last_obs, struct
+        if self.delta and previous is not None:
+            return describe_observation_delta(previous, struct)
+        return describe_observation(struct)
 
     def reset(self):
         obs, manual = self._env.reset()
         self._update_manual(manual)
         self.history.reset()
+        self._last_obs = None
+        struct = self.observe(obs)
         info = {
-            "obs": self.describe(obs),
+            "obs": self._describe_next(struct),
+            "obs_struct": struct,
             "manual": self.desc,
             "history": self.history.describe(),
             "score": 0,
@@ -122,11 +177,16 @@ The name specifications of in-game objects may not be exact matches. Please try
     def step(self, action):
         obs, reward, done, info = self._env.step(action)
         try:
-            description = self.describe(obs, action)
+            struct = self.observe(obs, action)
+            description = self._describe_next(struct)
         except:
+            # The next delta starts over from a full observation.
+            self._last_obs = None
+            struct = None
             description = "Environment Error."
         info={
             "obs": description,
+            "obs_struct": struct,
             "manual": self.desc,
             "history": self.history.describe(),
             "score": reward,
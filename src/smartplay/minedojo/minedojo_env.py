@@ -1,7 +1,7 @@
 import gym
 from gym import error, spaces, utils
 from gym.utils import seeding
-from ..utils import HistoryTracker, describe_act
+from ..utils import Entity, HistoryTracker, Observation, describe_act
 
 import random
 import itertools
@@ -113,10 +113,9 @@ def get_direction(yaw, pitch):
 
     return direction + " to " + ("front" if "-".join(direction_list) == "" else "-".join(direction_list))
 
-def describe_surround(obs):
-    # print("What blocks are around me?")
-    # print()
-    result = "Around you:\n"
+def surrounding_blocks(obs):
+    # Nearest connected component of each kind of block around the agent, as
+    # Entity records with the distance in blocks.
     
     # Voxel size (Can be changed based on the voxel space)
     voxel_x_size = 9
@@ -209,40 +208,44 @@ def describe_surround(obs):
             
             block2dir[block_name] = direction_str.strip()
         
-    # Finally print the blocks
-    for block_name in block2dist:
-        direction_str = block2dir[block_name]
-        result += f" - {block_name}, {'%.2f' % block2dist[block_name]} blocks away, {direction_str}\n"
-        
+    return tuple(Entity(str(block_name), float(block2dist[block_name]), block2dir[block_name]) for block_name in block2dist)
+
+def describe_blocks_around(blocks):
+    result = "Around you:\n"
+    for block in blocks:
+        result += f" - {block.kind}, {'%.2f' % block.distance} blocks away, {block.direction}\n"
     return result.strip()
 
+def describe_surround(obs):
+    return describe_blocks_around(surrounding_blocks(obs))
+
 # Describe the block the agent is facing to
 
-def describe_cursor(obs):
-    
+def cursor_block(obs):
     # Track the cursor using lidar
-    cursor_block = obs["rays"]["block_name"][0]
-    
+    return str(obs["rays"]["block_name"][0])
+
+def describe_cursor_block(block):
     # Skip if the cursor is pointing to air
-    if cursor_block == 'air':
+    if block == 'air':
         return "You're not aiming at any block."
     else:
-        return f"You're aiming at {cursor_block}."
+        return f"You're aiming at {block}."
+
+def describe_cursor(obs):
+    return describe_cursor_block(cursor_block(obs))
 
 # Describe the surrounding entities around the agent
 
-def describe_entity(obs):
-    result = ""
+def visible_components(obs, names_key, distance_key, skip):
+    # Connected components of the lidar rays hitting the same kind of thing, as
+    # Entity records with the nearest distance, and the share of the screen
+    # each one takes.
     my_yaw = obs["location_stats"]["yaw"]
     my_pitch = obs["location_stats"]["pitch"]
-    
-    # Number of pitch/yaw rays (Can be changed based on the lidar rays)
-    
-    # A flag indicating where there are entities around
-    see_entity = False
 
     # Reshape and convert the list into np array
-    entity_names = np.array(obs["rays"]["entity_name"][1:].reshape(pitch_cnt,yaw_cnt))
+    entity_names = np.array(obs["rays"][names_key][1:].reshape(pitch_cnt,yaw_cnt))
 
     # Encode the block name using its unique index
     unique_entity_names, unique_entity_indices = np.unique(entity_names, return_inverse=True)
@@ -260,14 +263,13 @@ def describe_entity(obs):
             label_2_entity_name[label] = entity_name
 
     # Describe each component
+    entities, shares = [], []
     for i in range(labels_count + 1):
         entity_name = label_2_entity_name[i]
 
         # Skip the null entity
-        if entity_name == "null": 
+        if entity_name in skip:
             continue
-        else: 
-            see_entity = True
 
         # Find all the indices of this component
         all_idx = np.where(entity_names_labels == i)
@@ -278,97 +280,57 @@ def describe_entity(obs):
         direction = ""
         for row, col in zip(all_idx[0], all_idx[1]):
             index = row * yaw_cnt + col
-            distance = obs["rays"]["entity_distance"][index+1]
+            distance = obs["rays"][distance_key][index+1]
             if distance < min_distance:
                 min_distance = distance
                 yaw = ((col / (yaw_cnt-1)) * FOV - FOV/2 + my_yaw + 540) % 360 - 180
                 pitch = (row / (pitch_cnt-1)) * 180 - 90 + my_pitch
                 direction = get_direction(yaw, pitch)
 
-        amount_description = "taking {0:.0f}% of screen".format(amount/(pitch_cnt*yaw_cnt)*100)
-
-        result+=f" - {entity_name}, {'%.2f' % min_distance} blocks away, {direction}, {amount_description}\n"
-        
-    # If there are no surrounding entities that the agent can see
-    if not see_entity:
-        result = ""
-    
-    return result
-
-# Describe the surrounding entities around the agent
+        entities.append(Entity(str(entity_name), float(min_distance), direction))
+        shares.append(float(amount/(pitch_cnt*yaw_cnt)))
 
-def describe_obj(obs):
-    result = "You see:\n"
-    my_yaw = obs["location_stats"]["yaw"]
-    my_pitch = obs["location_stats"]["pitch"]
-    
-    # Number of pitch/yaw rays (Can be changed based on the lidar rays)
-    
-    # A flag indicating where there are entities around
-    see_entity = False
+    return tuple(entities), tuple(shares)
 
-    # Reshape and convert the list into np array
-    entity_names = np.array(obs["rays"]["block_name"][1:].reshape(pitch_cnt,yaw_cnt))
+def visible_entities(obs):
+    return visible_components(obs, "entity_name", "entity_distance", ("null",))
 
-    # Encode the block name using its unique index
-    unique_entity_names, unique_entity_indices = np.unique(entity_names, return_inverse=True)
-    entity_names_int = np.array(unique_entity_indices).reshape(entity_names.shape)
+def visible_blocks(obs):
+    return visible_components(obs, "block_name", "block_distance", ("null", "air"))
 
-    # Apply 2D connected components
-    entity_names_labels, labels_count = cc3d.connected_components(entity_names_int, return_N = True, connectivity = 8)
-
-    # Get the map: label -> entity name
-    label_2_entity_name = [""] * (labels_count + 1)
-    for i in range(pitch_cnt):
-        for j in range(yaw_cnt):
-            label = entity_names_labels[i][j]
-            entity_name = entity_names[i][j]
-            label_2_entity_name[label] = entity_name
-
-    # Describe each component
-    for i in range(labels_count + 1):
-        entity_name = label_2_entity_name[i]
-
-        # Skip the null entity
-        if entity_name in ("null", "air"): 
-            continue
-        else: 
-            see_entity = True
-
-        # Find all the indices of this component
-        all_idx = np.where(entity_names_labels == i)
-        amount = np.sum(entity_names_labels == i)
+def describe_components(entities, shares):
+    result = ""
+    for entity, share in zip(entities, shares):
+        amount_description = "taking {0:.0f}% of screen".format(share*100)
+        result+=f" - {entity.kind}, {'%.2f' % entity.distance} blocks away, {entity.direction}, {amount_description}\n"
+    return result
 
-        # Find the minimum distance inside each component
-        min_distance = math.inf
-        direction = ""
-        for row, col in zip(all_idx[0], all_idx[1]):
-            index = row * yaw_cnt + col
-            distance = obs["rays"]["block_distance"][index+1]
-            if distance < min_distance:
-                min_distance = distance
-                yaw = ((col / (yaw_cnt-1)) * FOV - FOV/2 + my_yaw + 540) % 360 - 180
-                pitch = ((row / (pitch_cnt-1)) * 180 - 90) + my_pitch
-                direction = get_direction(yaw, pitch)
-        
-        amount_description = "taking {0:.0f}% of screen".format(amount/(pitch_cnt*yaw_cnt)*100)
+def describe_entity(obs):
+    # Empty if the agent sees no entity
+    return describe_components(*visible_entities(obs))
 
-        result+=f" - {entity_name}, {'%.2f' % min_distance} blocks away, {direction}, {amount_description}\n"
-        
-    # If there are no surrounding entities that the agent can see
-    if not see_entity:
-        result = ""
+def describe_visible_blocks(blocks, shares):
+    # Empty if the agent sees no block
+    if not blocks:
+        return ""
+    return ("You see:\n" + describe_components(blocks, shares)).strip()
 
-    return result.strip()
+def describe_obj(obs):
+    return describe_visible_blocks(*visible_blocks(obs))
 
 # Describe the exact coordinate the agent is in
-def describe_location(obs):
+def location(obs):
+    # Position, yaw and pitch of the agent
+    pos = tuple(float(x) for x in obs["location_stats"]["pos"])
+    return pos, float(np.asarray(obs["location_stats"]["yaw"]).item()), float(np.asarray(obs["location_stats"]["pitch"]).item())
+
+def describe_position(pos, yaw, pitch):
     result = ""
 
-    coord_list = obs["location_stats"]["pos"]
+    coord_list = pos
     
     # Describe the direction the agent is currently facing
-    yaw = (obs["location_stats"]["yaw"]+180) % 360 - 180
+    yaw = (yaw+180) % 360 - 180
     
     direction_list = ["north", "north-east", "east", "south-east", "south", "south-west", "west", "north-west"]
     direction_index = (int((yaw // 22.5) + 1)) // 2 # Calculate the index mapping to the direction_list above
@@ -377,7 +339,6 @@ def describe_location(obs):
     direction_index += 4
 
     result = f"Coordinate ({'%.2f' % coord_list[0]},{'%.2f' % coord_list[1]},{'%.2f' % coord_list[2]}). Facing {direction_list[direction_index]}."    # Describe whether the agent is looking up or down
-    pitch = obs["location_stats"]["pitch"]
 
     if pitch < 0:
         result += " Looking up."
@@ -386,8 +347,28 @@ def describe_location(obs):
 
     return result.strip()
 
+def describe_location(obs):
+    return describe_position(*location(obs))
+
+def observe(obs, action=None):
+    # Structured observation of a frame, from which describe_observation
+    # renders the text.
+    pos, yaw, pitch = location(obs)
+    entities, entity_shares = visible_entities(obs)
+    blocks, block_shares = visible_blocks(obs)
+    return Observation(action=action, entities=entities, facing=cursor_block(obs),
+                       state=(("position", pos), ("yaw", yaw), ("pitch", pitch), ("around", surrounding_blocks(obs)),
+                              ("blocks", blocks), ("entity_screen", entity_shares), ("block_screen", block_shares)))
+
+def describe_observation(obs_struct):
+    state = dict(obs_struct.state)
+    result = describe_position(state["position"], state["yaw"], state["pitch"])+"\n\n"+describe_cursor_block(obs_struct.facing)+"\n"+describe_blocks_around(state["around"])+"\n"+describe_components(obs_struct.entities, state["entity_screen"])+"\n"+describe_visible_blocks(state["blocks"], state["block_screen"])
+    if obs_struct.action is not None:
+        result = "You took action {}.\n\n{}".format(obs_struct.action, result)
+    return result
+
 def describe_frame(obs):
-    return describe_location(obs)+"\n\n"+describe_cursor(obs)+"\n"+describe_surround(obs)+"\n"+describe_entity(obs)+"\n"+describe_obj(obs)
+    return describe_observation(observe(obs))
 
 class MineDojoEnv(gym.Env):
     default_iter = 20
@@ -440,16 +421,18 @@ In your observation, you are provided the amount of space an object takes in you
         return action
 
     def describe(self, obs, action=None):
-        if action is not None:
-            return "You took action {}.\n\n{}".format(self.action_list[action], describe_frame(obs))
-        else:
-            return describe_frame(obs)
+        return describe_observation(self.observe(obs, action))
+
+    def observe(self, obs, action=None):
+        return observe(obs, self.action_list[action] if action is not None else None)
 
     def reset(self):
         obs = self._env.reset()
         self.history.reset()
+        obs_struct = self.observe(obs)
         info = {
-            "obs": self.describe(obs),
+            "obs": describe_observation(obs_struct),
+            "obs_struct": obs_struct,
             "manual": self.desc,
             "history": self.history.describe(),
             "score": 0,
@@ -469,8 +452,10 @@ In your observation, you are provided the amount of space an object takes in you
             if obs["location_stats"]["biome_id"].item() in self.goal_set:
                 break
 
+        obs_struct = self.observe(obs, action)
         info.update({
-            "obs": self.describe(obs, action),
+            "obs": describe_observation(obs_struct),
+            "obs_struct": obs_struct,
             "manual": self.desc,
             "history": self.history.describe(),
             "score": 0,
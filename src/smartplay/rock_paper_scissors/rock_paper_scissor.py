@@ -2,7 +2,7 @@ import numpy as np
 import gym
 from gym import spaces
 from gym.utils import seeding
-from ..utils import HistoryTracker, describe_act
+from ..utils import HistoryTracker, Observation, describe_act
 import random
 
 
@@ -101,11 +101,13 @@ Your goal is to maximize your score.
         done = False
         optimal_action, expected_score = self.compute_optimal_action()
         self.score_tracker += int(action == optimal_action)
+        obs_struct = Observation(
+            action=self.action_list[action],
+            state=(("opponent", self.action_list[opponent_action]), ("result", result), ("reward", reward)),
+        )
         info = {
-            "obs": "You chose {}, and the opponent chose {}. You {} and received score {}.\nNew round begins.".format(
-                self.action_list[action], 
-                self.action_list[opponent_action], 
-                result, reward),
+            "obs": self.describe_observation(obs_struct),
+            "obs_struct": obs_struct,
             "manual": self.desc,
             "history": self.history.describe(),
             "score": self.score_tracker,
@@ -127,7 +129,8 @@ Your goal is to maximize your score.
         self.history.reset()
         self.score_tracker = 0
         info = {
-            "obs":"New round begins.",
+            "obs": self.describe_observation(Observation()),
+            "obs_struct": Observation(),
             "manual": self.desc,
             "history": self.history.describe(),
             "score": self.score_tracker,
@@ -136,6 +139,13 @@ Your goal is to maximize your score.
         self.history.step(info)
         return 0, info
 
+    def describe_observation(self, obs):
+        if obs.action is None:
+            return "New round begins."
+        state = dict(obs.state)
+        return "You chose {}, and the opponent chose {}. You {} and received score {}.\nNew round begins.".format(
+            obs.action, state["opponent"], state["result"], state["reward"])
+
     def render(self, mode='human', close=False):
         pass
 
@@ -1,34 +1,386 @@
+import collections.abc
 import copy
+import dataclasses
+import sys
+import types
+
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Entity:
+    """Something the agent perceives, `distance` steps away in `direction`."""
+    kind: str
+    distance: int
+    direction: str
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Observation:
+    """
+    Structured observation, provided as info['obs_struct'] by environments
+    whose text observation is rendered from it. Observations are immutable
+    and hashable, so they can be compared and used as keys directly.
+    """
+    action: str = None
+    # Conditions such as "sleeping" or "dead".
+    status: tuple = ()
+    # Entity records, the nearest one of each kind.
+    entities: tuple = ()
+    facing: str = None
+    # Pairs of item name and count.
+    inventory: tuple = ()
+    # Pairs of name and value for any other game state.
+    state: tuple = ()
+
+
+class _Deferred:
+    # Evaluates `fn` on first call only. Copies of a LazyInfo share instances,
+    # so a value is computed at most once however often the info is copied.
+    __slots__ = ('fn', 'value')
+
+    def __init__(self, fn) -> None:
+        self.fn = fn
+        self.value = None
+
+    def __call__(self):
+        if self.fn is not None:
+            self.value = self.fn()
+            self.fn = None
+        return self.value
+
+
+class LazyInfo(collections.abc.MutableMapping, dict):
+    """
+    Info dict whose lazy entries are computed on first access and then cached.
+    Each lazy entry is a function without arguments, which must not depend on
+    state that changes after the step, as it may be evaluated much later.
+    """
+    # A dict subclass, as gym's environment checker and others require infos
+    # to be dicts. The dict storage holds the evaluated entries, while the
+    # mapping methods come from MutableMapping and see the lazy ones too.
+
+    def __init__(self, values=None, **lazy) -> None:
+        dict.__init__(self, values or {})
+        self._lazy = {}
+        for key, fn in lazy.items():
+            self.set_lazy(key, fn)
+
+    def set_lazy(self, key, fn):
+        # Returns the cached entry as a function, for other lazy entries that
+        # depend on it without looking it up in the info later.
+        dict.pop(self, key, None)
+        self._lazy[key] = _Deferred(fn)
+        return self._lazy[key]
+
+    def __getitem__(self, key):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        if key in self._lazy:
+            value = self._lazy.pop(key)()
+            dict.__setitem__(self, key, value)
+            return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value) -> None:
+        self._lazy.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key) -> None:
+        if key in self._lazy:
+            del self._lazy[key]
+        else:
+            dict.__delitem__(self, key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._lazy
+
+    def __iter__(self):
+        # Iterating may evaluate entries, so iterate over a copy of the keys.
+        return iter(list(dict.keys(self)) + list(self._lazy))
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._lazy)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __copy__(self):
+        return self.project(None)
+
+    copy = __copy__
+
+    def __reduce__(self):
+        # Pickles and deep copies hold the values, evaluating lazy entries.
+        return LazyInfo, (dict(self.items()),)
+
+    def project(self, keys):
+        # Copy holding only `keys` (all if None) without evaluating anything.
+        result = LazyInfo.__new__(LazyInfo)
+        dict.__init__(result, {k: v for k, v in dict.items(self) if keys is None or k in keys})
+        result._lazy = {k: v for k, v in self._lazy.items() if keys is None or k in keys}
+        return result
+
+    def evaluated(self):
+        return dict(dict.items(self))
+
+    def __repr__(self):
+        return "LazyInfo({}, lazy={})".format(self.evaluated(), list(self._lazy))
+
+
+def approx_token_len(text):
+    # Rough token count for English text, about four characters per token.
+    return (len(text) + 3) // 4
+
+
+_HISTORY_HEADER = "Most recent {} steps of the player's in-game observation:\n\n"
+_HISTORY_SUMMARY = "Player observations of steps {} to {} are omitted.\n\n"
+
+
+class _Entry:
+    # One step of history. The formatted chunk and its token count are cached.
+    __slots__ = ('info', 'step', 'chunk', 'tokens')
+
+    def __init__(self, info, step) -> None:
+        self.info = info
+        self.step = step
+        self.chunk = None
+        self.tokens = None
+
+    def format(self):
+        if self.chunk is None:
+            self.chunk = "Player Observation Step {}:\n{}\n\n".format(self.step, self.info["obs"])
+        return self.chunk
+
+    def count(self, token_len):
+        if self.tokens is None:
+            self.tokens = token_len(self.format())
+        return self.tokens
+
+
+def _project(info, fields):
+    if fields is None:
+        return copy.copy(info)
+    if isinstance(info, LazyInfo):
+        return info.project(fields)
+    return {k: info[k] for k in fields if k in info}
+
+
+def _closure(fn):
+    # Values a function closes over, skipping variables not assigned yet.
+    values = []
+    for cell in fn.__closure__ or ():
+        try:
+            values.append(cell.cell_contents)
+        except ValueError:
+            pass
+    return values
+
+
+def _sizeof(value, seen=None):
+    # Approximate bytes held by `value`, including what pending lazy entries
+    # close over. Shared values are counted once, and objects other than
+    # containers, arrays and functions are counted without their attributes.
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, _Deferred):
+        return sys.getsizeof(value) + _sizeof(value.value if value.fn is None else value.fn, seen)
+    if isinstance(value, types.FunctionType):
+        return sys.getsizeof(value) + sum(_sizeof(v, seen) for v in _closure(value))
+    if isinstance(value, LazyInfo):
+        return (sys.getsizeof(value) + sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in value.evaluated().items())
+                + sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in value._lazy.items()))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_sizeof(v, seen) for v in value)
+    return sys.getsizeof(value)
+
+
 class HistoryTracker:
+    """
+    Keeps the most recent `max_steps` infos in a ring buffer. Each entry caches
+    its formatted text, so describe() is a single join, and the description is
+    cached until the next step.
 
-    def __init__(self, max_steps) -> None:
+    Only the info `fields` are retained, by default the ones describe() and
+    score() use. Envs that need more declare them here; None keeps everything.
+
+    With a `token_budget`, describe() also drops the oldest entries until the
+    description fits, as measured by `token_len`. With overflow="summarize"
+    the dropped entries are replaced by a one-line note instead.
+    """
+
+    def __init__(self, max_steps, fields=("obs", "score"), token_budget=None, token_len=approx_token_len, overflow="drop") -> None:
         self.max_steps = max_steps
+        self.fields = fields
         self.game_step = 0
         self.reset()
+        self.set_token_budget(token_budget, token_len, overflow)
+
+    def set_token_budget(self, token_budget, token_len=approx_token_len, overflow="drop") -> None:
+        if overflow not in ("drop", "summarize"):
+            raise ValueError("Unknown overflow mode `{}`.".format(overflow))
+        self.token_budget = token_budget
+        self.token_len = token_len
+        self.overflow = overflow
+        self._description = None
+        for entry in self._ordered():
+            entry.tokens = None
 
     def step(self, info) -> None:
-        self.info.append(copy.copy(info))
-        if len(self.info) > self.max_steps:
-            self.info.pop(0)
+        if self.max_steps > 0:
+            self._entries[self._head] = _Entry(_project(info, self.fields), self.game_step)
+            self._head = (self._head + 1) % self.max_steps
+            self._size = min(self._size + 1, self.max_steps)
         self.game_step += 1
+        self._description = None
 
     def reset(self) -> None:
-        self.info = []
+        self._entries = [None] * self.max_steps
+        self._head = 0
+        self._size = 0
+        self._description = None
         self.game_step = 0
-    
+
+    @property
+    def info(self):
+        return [entry.info for entry in self._ordered()]
+
+    def _ordered(self):
+        start = self._head - self._size
+        return [self._entries[i % self.max_steps] for i in range(start, self._head)]
+
+    def snapshot(self):
+        return tuple(self._ordered()), self.game_step
+
+    def restore(self, snapshot) -> None:
+        entries, game_step = snapshot
+        self.reset()
+        for entry in entries:
+            self._entries[self._head] = entry
+            self._head = (self._head + 1) % self.max_steps
+            self._size += 1
+        self.game_step = game_step
+
     def describe(self, game_step=None):
-        if len(self.info) == 0:
+        if game_step is not None and game_step != self.game_step:
+            # Step labels differ from the cached chunks, so format from scratch.
+            return self._describe(self.info, game_step)
+        if self._description is None:
+            self._description = self._join(self._ordered())
+        return self._description
+
+    def deferred_describe(self):
+        # Returns a function producing the current description, for LazyInfo.
+        if self._description is not None:
+            description = self._description
+            return lambda: description
+        entries = self._ordered()
+        return lambda: self._join(entries)
+
+    def _join(self, entries):
+        if len(entries) == 0:
+            return ""
+        omitted = self._overflow(entries) if self.token_budget is not None else 0
+        kept = entries[omitted:]
+        result = _HISTORY_HEADER.format(len(kept)) + "".join([entry.format() for entry in kept]) if kept else ""
+        if omitted > 0 and self.overflow == "summarize":
+            result = _HISTORY_SUMMARY.format(entries[0].step, entries[omitted - 1].step) + result
+        return result.strip()
+
+    def _overflow(self, entries):
+        # Number of oldest entries to leave out to stay within the budget.
+        budget = self.token_budget - self.token_len(_HISTORY_HEADER.format(len(entries)))
+        tokens = [entry.count(self.token_len) for entry in entries]
+        if sum(tokens) <= budget:
+            return 0
+        if self.overflow == "summarize":
+            budget -= self.token_len(_HISTORY_SUMMARY.format(entries[0].step, entries[-1].step))
+        omitted = len(entries)
+        while omitted > 0 and tokens[omitted - 1] <= budget:
+            omitted -= 1
+            budget -= tokens[omitted]
+        return omitted
+
+    @staticmethod
+    def _describe(history, game_step):
+        if len(history) == 0:
             return ""
-        game_step = self.game_step if game_step is None else game_step
-        result = "Most recent {} steps of the player's in-game observation:\n\n".format(len(self.info))
-        for i, info in enumerate(self.info):
-            result += "Player Observation Step {}:\n".format(game_step - len(self.info) + i)
+        result = _HISTORY_HEADER.format(len(history))
+        for i, info in enumerate(history):
+            result += "Player Observation Step {}:\n".format(game_step - len(history) + i)
             result += info["obs"] + "\n\n"
         return result.strip()
-    
+
     def score(self):
-        return sum([info["score"] for info in self.info])
+        return sum([entry.info["score"] for entry in self._ordered()])
+
+    def retained_bytes(self):
+        # Approximate memory held by the window, counting the fields, with what
+        # their pending lazy entries close over, cached chunks and the cached
+        # description. Values shared between entries are counted once.
+        seen = set()
+        total = _sizeof(self._description or "", seen)
+        for entry in self._ordered():
+            total += _sizeof(entry.info, seen) + _sizeof(entry.chunk or "", seen)
+        return total
 
 
 def describe_act(action_list):
     return "List of all actions:\n" + "\n".join(["{}. {}".format(i+1, s) for i,s in enumerate(action_list)])
+
+
+class ActionMatcher:
+    """
+    Finds the action named in an LLM answer: the action mentioned first, and
+    of actions mentioned at the same position the one listed first, ignoring
+    case. Answers that name no action give `default`.
+    """
+
+    def __init__(self, action_list, default=0) -> None:
+        self.action_list = list(action_list)
+        self.default = default
+        self._actions = [action.lower() for action in self.action_list]
+
+    def __call__(self, output):
+        index = self.find(output)
+        return self.default if index is None else index
+
+    def find(self, output):
+        # Index of the matched action, or None. Once an action is found, the
+        # others are only searched for before it. str.find is much faster
+        # than a regex alternation of the actions.
+        text = output.lower()
+        best, best_pos = None, None
+        for i, action in enumerate(self._actions):
+            if best_pos is None:
+                pos = text.find(action)
+            else:
+                pos = text.find(action, 0, best_pos + len(action) - 1)
+            if pos != -1:
+                best, best_pos = i, pos
+                if pos == 0:
+                    break
+        return best
+
+
+def describe_changes(previous, current):
+    """
+    Lists what changed between two dicts mapping names to descriptions, one
+    line per name that is new, changed or gone.
+    """
+    lines = []
+    for name, desc in current.items():
+        if name not in previous:
+            lines.append("- {}: {} (new)".format(name, desc))
+        elif previous[name] != desc:
+            lines.append("- {}: {} (was {})".format(name, desc, previous[name]))
+    for name in previous:
+        if name not in current:
+            lines.append("- {}: no longer there".format(name))
+    return lines